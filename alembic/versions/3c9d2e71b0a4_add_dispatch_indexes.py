@@ -0,0 +1,46 @@
+"""add dispatch indexes
+
+Revision ID: 3c9d2e71b0a4
+Revises: faa7b5a268ae
+Create Date: 2026-10-18
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "3c9d2e71b0a4"
+down_revision: Union[str, None] = "faa7b5a268ae"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently so a live bot keeps labeling during the migration
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_items_pending_created_at",
+            "items",
+            [sa.text("created_at DESC"), sa.text("id DESC")],
+            postgresql_where=sa.text("status = 'pending'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_labels_user_item",
+            "labels",
+            ["user_id", "item_id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_labels_user_item", table_name="labels", postgresql_concurrently=True)
+        op.drop_index(
+            "ix_items_pending_created_at", table_name="items", postgresql_concurrently=True
+        )
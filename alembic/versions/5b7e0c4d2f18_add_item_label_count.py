@@ -0,0 +1,65 @@
+"""add item label count
+
+Revision ID: 5b7e0c4d2f18
+Revises: 8e41c6f3a9d2
+Create Date: 2026-10-18
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "5b7e0c4d2f18"
+down_revision: Union[str, None] = "8e41c6f3a9d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default does not rewrite the table
+    op.add_column(
+        "items", sa.Column("label_count", sa.Integer(), nullable=False, server_default="0")
+    )
+    op.execute(
+        """
+        UPDATE items SET label_count = counted.n
+        FROM (
+            SELECT item_id, count(*) AS n FROM labels WHERE action = 'rated' GROUP BY item_id
+        ) AS counted
+        WHERE items.id = counted.item_id
+        """
+    )
+
+    # Commits the backfill first; the index is built while the bot keeps running
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_items_dispatch",
+            "items",
+            [sa.text("label_count DESC"), sa.text("created_at DESC"), sa.text("id DESC")],
+            postgresql_where=sa.text("status = 'pending'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_items_pending_created_at",
+            table_name="items",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_items_pending_created_at",
+            "items",
+            [sa.text("created_at DESC"), sa.text("id DESC")],
+            postgresql_where=sa.text("status = 'pending'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index("ix_items_dispatch", table_name="items", postgresql_concurrently=True)
+    op.drop_column("items", "label_count")
@@ -0,0 +1,51 @@
+"""add label rollups
+
+Revision ID: 8e41c6f3a9d2
+Revises: 3c9d2e71b0a4
+Create Date: 2026-10-18
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8e41c6f3a9d2"
+down_revision: Union[str, None] = "3c9d2e71b0a4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "label_rollups",
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("hour", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("duration_bin", sa.SmallInteger(), nullable=False),
+        sa.Column("rated", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("skipped", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("user_id", "hour", "duration_bin"),
+        sa.ForeignKeyConstraint(["user_id"], ["users.telegram_id"]),
+    )
+    op.create_index("ix_label_rollups_hour", "label_rollups", ["hour"])
+
+    # Existing labels carry no timing, so they go to the "unknown duration" bin (-1)
+    op.execute(
+        """
+        INSERT INTO label_rollups (user_id, hour, duration_bin, rated, skipped)
+        SELECT user_id,
+               date_trunc('hour', created_at),
+               -1,
+               count(*) FILTER (WHERE action = 'rated'),
+               count(*) FILTER (WHERE action = 'skipped')
+        FROM labels
+        GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_label_rollups_hour", table_name="label_rollups")
+    op.drop_table("label_rollups")
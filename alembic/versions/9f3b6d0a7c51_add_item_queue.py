@@ -0,0 +1,138 @@
+"""add item queue
+
+Revision ID: 9f3b6d0a7c51
+Revises: c2a8f61e9d37
+Create Date: 2026-10-18
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "9f3b6d0a7c51"
+down_revision: Union[str, None] = "c2a8f61e9d37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Until no replica of the previous version is left, both tables are written:
+# the old code updates items, the new one item_queue. These triggers mirror
+# each write into the other table; pg_trigger_depth() keeps a mirrored write
+# from bouncing back. The next release drops them together with
+# ix_items_dispatch and ix_items_status.
+SYNC = (
+    """
+    CREATE FUNCTION items_sync_queue() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF pg_trigger_depth() > 1 OR (
+            TG_OP = 'UPDATE'
+            AND (OLD.status, OLD.label_count) IS NOT DISTINCT FROM (NEW.status, NEW.label_count)
+        ) THEN
+            RETURN NULL;
+        END IF;
+        IF NEW.status IN ('pending', 'locked') THEN
+            INSERT INTO item_queue (item_id, status, label_count, created_at, text_len)
+            VALUES (NEW.id, NEW.status, NEW.label_count, NEW.created_at, length(NEW.text))
+            ON CONFLICT (item_id) DO UPDATE
+            SET status = EXCLUDED.status, label_count = EXCLUDED.label_count
+            WHERE (item_queue.status, item_queue.label_count)
+                IS DISTINCT FROM (EXCLUDED.status, EXCLUDED.label_count);
+        ELSE
+            DELETE FROM item_queue WHERE item_id = NEW.id;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER items_sync_queue AFTER INSERT OR UPDATE OF status, label_count ON items
+    FOR EACH ROW EXECUTE FUNCTION items_sync_queue()
+    """,
+    """
+    CREATE FUNCTION item_queue_sync_items() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF pg_trigger_depth() > 1 THEN
+            RETURN NULL;
+        END IF;
+        UPDATE items SET status = NEW.status, label_count = NEW.label_count
+        WHERE id = NEW.item_id
+          AND (status, label_count) IS DISTINCT FROM (NEW.status, NEW.label_count);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER item_queue_sync_items AFTER INSERT OR UPDATE OF status, label_count ON item_queue
+    FOR EACH ROW EXECUTE FUNCTION item_queue_sync_items()
+    """,
+)
+UNSYNC = (
+    "DROP TRIGGER IF EXISTS item_queue_sync_items ON item_queue",
+    "DROP FUNCTION IF EXISTS item_queue_sync_items()",
+    "DROP TRIGGER IF EXISTS items_sync_queue ON items",
+    "DROP FUNCTION IF EXISTS items_sync_queue()",
+)
+
+# FOR SHARE waits for an in-flight write of the old code and re-checks the row,
+# and holds off later ones until the chunk commits, so their trigger sees it
+BACKFILL = sa.text(
+    """
+    INSERT INTO item_queue (item_id, status, label_count, created_at, text_len)
+    SELECT id, status, label_count, created_at, length(text) FROM items
+    WHERE id >= :lo AND id < :hi AND status IN ('pending', 'locked')
+    FOR SHARE
+    ON CONFLICT (item_id) DO NOTHING
+    """
+)
+BACKFILL_CHUNK = 50_000  # item ids per backfill transaction
+
+
+def upgrade() -> None:
+    # Nothing reads item_queue yet; the triggers go in with the empty table,
+    # so every write to items from here on reaches it
+    op.create_table(
+        "item_queue",
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("label_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("text_len", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["item_id"], ["items.id"]),
+        sa.PrimaryKeyConstraint("item_id"),
+    )
+    op.create_index(
+        "ix_item_queue_dispatch",
+        "item_queue",
+        [sa.text("label_count DESC"), sa.text("created_at DESC"), sa.text("item_id DESC")],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+    op.create_index(
+        "ix_item_queue_status",
+        "item_queue",
+        ["status"],
+        postgresql_where=sa.text("status <> 'pending'"),
+    )
+    for statement in SYNC:
+        op.execute(statement)
+
+    # The backfill runs in short transactions so the running bot is only held
+    # up on the items of the current chunk
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        max_id = bind.execute(sa.text("SELECT coalesce(max(id), 0) FROM items")).scalar_one()
+        for lo in range(0, max_id + 1, BACKFILL_CHUNK):
+            bind.execute(BACKFILL, {"lo": lo, "hi": lo + BACKFILL_CHUNK})
+
+
+def downgrade() -> None:
+    for statement in UNSYNC:
+        op.execute(statement)
+    op.execute(
+        """
+        UPDATE items SET status = q.status, label_count = q.label_count
+        FROM item_queue q WHERE items.id = q.item_id
+        """
+    )
+    op.drop_table("item_queue")
@@ -0,0 +1,46 @@
+"""add export watermarks
+
+Revision ID: c2a8f61e9d37
+Revises: 5b7e0c4d2f18
+Create Date: 2026-10-18
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c2a8f61e9d37"
+down_revision: Union[str, None] = "5b7e0c4d2f18"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "export_watermarks",
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("exported_until", sa.DateTime(timezone=True), nullable=False),
+        sa.Column(
+            "updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+    # labels is the hot table; build the index without blocking inserts
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_labels_created_at",
+            "labels",
+            ["created_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_labels_created_at", table_name="labels", postgresql_concurrently=True)
+    op.drop_table("export_watermarks")
@@ -0,0 +1,122 @@
+"""Minimal fake Telegram Bot API server for local load and rate-limit testing.
+
+Implements the handful of methods the bot calls and enforces Telegram-like
+flood limits: chat message calls above ``--global-rate`` overall or
+``--chat-rate`` per chat get ``429`` with ``retry_after``, as the real API
+does. Point the bot at it with ``BOT_TELEGRAM_API_URL``:
+
+    python -m benchmarks.fakeapi --port 8081
+    BOT_TELEGRAM_API_URL=http://localhost:8081 python -m bot
+
+``GET /stats`` returns the call and 429 counts per method.
+"""
+
+import argparse
+import asyncio
+import itertools
+import math
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Calls that count against the message limits
+LIMITED = {"sendMessage", "sendDocument", "editMessageText", "editMessageReplyMarkup", "deleteMessage"}
+
+
+class Limit:
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait(self) -> float:
+        """Seconds until a token is available, 0 if there is one now."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class FakeBotAPI:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.global_limit = Limit(args.global_rate, args.global_rate)
+        self.chat_limits: dict[str, Limit] = {}
+        self.calls: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self.message_ids = itertools.count(1)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        self.calls[method] += 1
+
+        if self.args.latency_ms:
+            await asyncio.sleep(self.args.latency_ms / 1000)
+
+        if method in LIMITED:
+            chat_id = str(params.get("chat_id"))
+            chat = self.chat_limits.setdefault(chat_id, Limit(self.args.chat_rate, self.args.chat_burst))
+            wait = max(chat.wait(), self.global_limit.wait())
+            if wait:
+                self.throttled[method] += 1
+                retry_after = math.ceil(wait)
+                return web.json_response(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {retry_after}",
+                        "parameters": {"retry_after": retry_after},
+                    },
+                    status=429,
+                )
+            chat.tokens -= 1
+            self.global_limit.tokens -= 1
+
+        return web.json_response({"ok": True, "result": await self.result(method, params)})
+
+    async def result(self, method: str, params: dict) -> object:
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        if method == "getUpdates":
+            await asyncio.sleep(min(float(params.get("timeout", 0)), 1))
+            return []
+        if method in {"sendMessage", "sendDocument", "editMessageText", "editMessageReplyMarkup"}:
+            message_id = params.get("message_id") or next(self.message_ids)
+            return {
+                "message_id": int(message_id),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": self.calls, "throttled": self.throttled})
+
+
+def make_app(args: argparse.Namespace) -> web.Application:
+    api = FakeBotAPI(args)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/stats", api.stats)
+    app.router.add_route("*", "/bot{token}/{method}", api.handle)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--global-rate", type=float, default=30)
+    parser.add_argument("--chat-rate", type=float, default=1)
+    parser.add_argument("--chat-burst", type=float, default=3)
+    parser.add_argument("--latency-ms", type=float, default=0, help="added to every response")
+    args = parser.parse_args()
+    web.run_app(make_app(args), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
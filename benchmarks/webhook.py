@@ -0,0 +1,105 @@
+"""Post synthetic Telegram updates to a running webhook endpoint.
+
+Every simulated user sends ``--per-user`` messages (``/stats`` by default)
+with increasing ``update_id``s, all users at once, the way Telegram does
+when many labelers are active. Prints the HTTP status counts and response
+latency of the webhook.
+
+    python -m benchmarks.webhook --url http://localhost:8080/webhook --users 100 --per-user 20
+
+The user ids must be whitelisted, otherwise the bot answers "Доступ запрещён".
+The bot still calls the real Bot API for its replies.
+"""
+
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from collections import Counter
+
+import aiohttp
+
+_update_ids = itertools.count(1)
+
+
+def message_update(user_id: int, text: str) -> dict:
+    update_id = next(_update_ids)
+    command = text.split()[0] if text.startswith("/") else None
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}] if command else [],
+        },
+    }
+
+
+def callback_update(user_id: int, message_id: int, data: str) -> dict:
+    """A press of the inline button with ``data`` under the bot's message ``message_id``."""
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "",
+            },
+        },
+    }
+
+
+async def post_user(
+    http: aiohttp.ClientSession, args: argparse.Namespace, user_id: int, statuses: Counter, timings: list[float]
+) -> None:
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    for _ in range(args.per_user):
+        started = time.perf_counter()
+        async with http.post(args.url, json=message_update(user_id, args.text), headers=headers) as resp:
+            await resp.read()
+            statuses[resp.status] += 1
+        timings.append((time.perf_counter() - started) * 1000)
+
+
+async def run(args: argparse.Namespace) -> None:
+    statuses: Counter = Counter()
+    timings: list[float] = []
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as http:
+        await asyncio.gather(
+            *(
+                post_user(http, args, user_id, statuses, timings)
+                for user_id in range(args.first_user_id, args.first_user_id + args.users)
+            )
+        )
+    elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(timings, n=100)
+    print(f"{len(timings)} updates in {elapsed:.2f}s ({len(timings) / elapsed:.0f}/s)")
+    print(f"statuses: {dict(statuses)}")
+    print(f"p50={cuts[49]:.2f}ms p95={cuts[94]:.2f}ms p99={cuts[98]:.2f}ms max={max(timings):.2f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080/webhook")
+    parser.add_argument("--secret", default="", help="value of BOT_WEBHOOK_SECRET")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--first-user-id", type=int, default=1)
+    parser.add_argument("--per-user", type=int, default=10, help="updates sent by each user, one after another")
+    parser.add_argument("--text", default="/stats", help="message text of every update")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,40 @@
 import asyncio
 import logging
+import signal
+from functools import partial
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
 from bot.config import settings
+from bot.db.pool import PoolReporter
 from bot.db.session import engine, sessionmaker
 from bot.middlewares.auth import AuthMiddleware
+from bot.middlewares.metrics import BotApiMetricsMiddleware, HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from bot.middlewares.sequencer import UserSequencerMiddleware
 from bot.handlers import admin, labeling
-from bot.services.cleanup import cleanup_stale_locks
+from bot.services import metrics
+from bot.services.archive import ARCHIVE_INTERVAL, archive_items
+from bot.services.cleanup import CLEANUP_INTERVAL, cleanup_stale_locks, watch_lock_expiry
+from bot.services.outbound import OutboundScheduler
+from bot.services.items import start_write_behind, stop_write_behind
 from bot.services.redis import redis
+from bot.services.scheduler import scheduler
+from bot.services.stats import refresh_stats
+from bot.services.user_cache import invalidate_users, listen_user_invalidations
+from bot.services.workers import shutdown_workers
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 log = logging.getLogger(__name__)
 
+POOL_REPORT_INTERVAL = 60  # seconds
+METRICS_REFRESH_INTERVAL = 15  # seconds between samples of the pool and queue gauges
+
 
 async def on_startup() -> None:
     # Seed admins from config
@@ -29,33 +48,137 @@ async def on_startup() -> None:
                 elif not existing.is_admin:
                     existing.is_admin = True
             await session.commit()
+        await invalidate_users(*settings.admin_ids)
         log.info("Seeded %d admin(s)", len(settings.admin_ids))
 
-    asyncio.create_task(cleanup_stale_locks(sessionmaker))
+    if settings.write_behind:
+        start_write_behind(sessionmaker)
+
+    # Periodic work runs on the elected leader only; cache invalidations reach every replica
+    scheduler.every(CLEANUP_INTERVAL, partial(cleanup_stale_locks, sessionmaker), name="cleanup")
+    scheduler.every(ARCHIVE_INTERVAL, partial(archive_items, sessionmaker), name="archive")
+    scheduler.every(settings.stats_reconcile_seconds, partial(refresh_stats, sessionmaker), name="stats")
+    if settings.lock_expiry_events:
+        scheduler.forever(partial(watch_lock_expiry, sessionmaker), name="lock-expiry")
+    if settings.user_cache_pubsub:
+        scheduler.forever(listen_user_invalidations, name="user-invalidations", leader_only=False)
+    scheduler.every(POOL_REPORT_INTERVAL, PoolReporter(engine.pool).report, name="db-pool", leader_only=False)
+    if metrics.enabled:
+        scheduler.every(
+            METRICS_REFRESH_INTERVAL, partial(metrics.refresh_gauges, engine), name="metrics", leader_only=False
+        )
+    scheduler.start()
     log.info("DB tables ensured")
 
 
 async def on_shutdown() -> None:
+    await scheduler.stop()
+    await stop_write_behind()
+    shutdown_workers()
     await redis.aclose()
     await engine.dispose()
     log.info("Connections closed")
 
 
-async def main() -> None:
-    session = AiohttpSession(proxy=settings.soocks5_proxy) if settings.soocks5_proxy else None
-    bot = Bot(token=settings.token, default=DefaultBotProperties(parse_mode=ParseMode.HTML), session=session)
+async def set_webhook(bot: Bot, dispatcher: Dispatcher) -> None:
+    if not settings.webhook_url:
+        log.warning("BOT_WEBHOOK_URL is not set, leaving the Telegram webhook as it is")
+        return
+    # Every replica registers the same URL, so this is safe to repeat
+    await bot.set_webhook(
+        settings.webhook_url.rstrip("/") + settings.webhook_path,
+        secret_token=settings.webhook_secret or None,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+
+
+async def healthz(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    dp.startup.register(set_webhook)
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=settings.webhook_secret or None
+    ).register(app, path=settings.webhook_path)
+    app.router.add_get("/healthz", healthz)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, settings.webhook_host, settings.webhook_port).start()
+    log.info("Serving webhook on %s:%d%s", settings.webhook_host, settings.webhook_port, settings.webhook_path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()  # runs dp shutdown hooks
+
+
+def create_session() -> AiohttpSession:
+    api = TelegramAPIServer.from_base(settings.telegram_api_url) if settings.telegram_api_url else PRODUCTION
+    session = AiohttpSession(api=api, proxy=settings.soocks5_proxy)
+    session.middleware(
+        OutboundScheduler(
+            global_rate=settings.outbound_global_rate,
+            chat_rate=settings.outbound_chat_rate,
+            chat_burst=settings.outbound_chat_burst,
+            max_retries=settings.outbound_max_retries,
+        )
+    )
+    if metrics.enabled:
+        session.middleware(BotApiMetricsMiddleware())
+    return session
+
+
+def create_dispatcher() -> Dispatcher:
+    """Dispatcher with the middlewares and routers, without startup/shutdown hooks."""
     dp = Dispatcher()
 
+    if metrics.enabled:
+        dp.update.outer_middleware(UpdateMetricsMiddleware())
+
     dp.update.middleware(AuthMiddleware(sessionmaker))
 
+    # Replicas behind a load balancer may get one user's updates at the same time
+    sequencer = UserSequencerMiddleware(distributed=settings.mode == "webhook")
+    labeling.router.message.middleware(sequencer)
+    labeling.router.callback_query.middleware(sequencer)
+
+    # After the sequencer, so handler time excludes waiting for the user's turn
+    if metrics.enabled:
+        for router in (admin.router, labeling.router):
+            router.message.middleware(HandlerMetricsMiddleware())
+            router.callback_query.middleware(HandlerMetricsMiddleware())
+
     dp.include_router(admin.router)
     dp.include_router(labeling.router)
+    return dp
+
+
+async def main() -> None:
+    metrics.start_metrics_server()
+    metrics.instrument_engine(engine)
+
+    bot = Bot(
+        token=settings.token, default=DefaultBotProperties(parse_mode=ParseMode.HTML), session=create_session()
+    )
+    dp = create_dispatcher()
 
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
-    log.info("Starting bot…")
-    await dp.start_polling(bot)
+    log.info("Starting bot in %s mode…", settings.mode)
+    if settings.mode == "webhook":
+        await run_webhook(bot, dp)
+    else:
+        await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 import os
+from typing import Literal
 
 from pydantic_settings import BaseSettings
 
@@ -6,9 +7,49 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     token: str
     database_url: str = ""
+    db_pool_size: int = 10
+    db_max_overflow: int = 10  # extra connections opened under bursts, closed when returned
+    db_pool_timeout: float = 30  # seconds a checkout may wait before failing
+    db_pool_recycle: int = 1800  # seconds before a connection is replaced, -1 to never
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 100  # prepared statements per connection, 0 behind pgbouncer
     redis_url: str = "redis://redis:6379/0"
     admin_ids: list[int] = []
+    mode: Literal["polling", "webhook"] = "polling"
+    webhook_url: str = ""  # public base URL Telegram posts to, e.g. https://bot.example.com
+    webhook_path: str = "/webhook"
+    webhook_secret: str = ""  # checked against X-Telegram-Bot-Api-Secret-Token
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    sequencer_lock_ms: int = 10_000  # turn lease, renewed while handled; lapses only if a replica dies
+    sequencer_reorder_ms: int = 20  # wait for earlier updates of the user still in flight, 0 to skip
     lock_ttl_seconds: int = 900  # 15 min
+    lock_expiry_events: bool = True  # reclaim items on Redis key expiry, not only by the sweep
+    label_overlap: int = 1  # distinct users who rate each item before it counts as labeled
+    dispatch_rescan_seconds: int = 30  # a labeler's dispatch restarts from the head of the queue this often
+    batch_size: int = 0  # short items per message in batch mode (up to 8), 0 or 1 for one item per message
+    batch_max_chars: int = 280  # longer texts are always shown one per message
+    edit_in_place: bool = True  # show the next task by editing the labeled message, not delete + send
+    prefetch_size: int = 0  # items claimed ahead per labeler, 0 disables the buffer
+    prefetch_idle_seconds: int = 300  # buffers of users idle this long go back to pending
+    write_behind: bool = False  # batch label writes from concurrent clicks into one transaction
+    write_behind_flush_ms: int = 20
+    write_behind_batch_size: int = 500
+    user_cache_ttl_seconds: int = 300
+    user_cache_negative_ttl_seconds: int = 30  # unknown users, absorbs floods from strangers
+    user_cache_size: int = 10_000
+    user_cache_pubsub: bool = True  # broadcast invalidations to other replicas via Redis
+    worker_threads: int = 4  # pool for polars/py7zr work off the event loop
+    worker_processes: int = 2  # pool for pure-Python CPU work (hashing)
+    heavy_jobs_max: int = 1  # imports/exports allowed to run at once
+    leader_lease_seconds: int = 15  # replica running the periodic jobs; others take over after this
+    stats_reconcile_seconds: int = 600  # recount /admin stats counters from the DB this often
+    metrics_port: int | None = None  # serve Prometheus metrics here (needs the "metrics" extra)
+    telegram_api_url: str | None = None  # e.g. a local Bot API server or benchmarks.fakeapi
+    outbound_global_rate: float = 25  # messages per second across all chats, under Telegram's ~30
+    outbound_chat_rate: float = 1  # messages per second in one chat, after the burst
+    outbound_chat_burst: int = 3
+    outbound_max_retries: int = 3  # retries of a call that got 429 retry_after
     soocks5_proxy: str | None = None
     model_config = {"env_prefix": "BOT_", "env_file": ".env"}
 
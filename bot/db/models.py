@@ -5,6 +5,8 @@ from sqlalchemy import (
     Boolean,
     DateTime,
     ForeignKey,
+    Index,
+    Integer,
     SmallInteger,
     String,
     Text,
@@ -28,18 +30,66 @@ class User(Base):
 
 
 class Item(Base):
+    """Catalog of imported texts. Dispatch state lives in ``item_queue`` until the item is done."""
+
     __tablename__ = "items"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     text: Mapped[str] = mapped_column(Text, nullable=False)
     text_hash: Mapped[str] = mapped_column(String(32), unique=True, nullable=False)
+    # Final status and label count, written when the item leaves item_queue.
+    # While replicas of the previous version may still run, the add item queue
+    # migration's triggers also mirror item_queue here
     status: Mapped[str] = mapped_column(String(16), default="pending", index=True)
+    label_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), index=True
     )
 
     labels: Mapped[list["Label"]] = relationship(back_populates="item")
 
+    __table_args__ = (
+        # Dispatch index of the previous version, which reads items; dropped
+        # with the sync triggers in the next release
+        Index(
+            "ix_items_dispatch",
+            label_count.desc(),
+            created_at.desc(),
+            id.desc(),
+            postgresql_where=status == "pending",
+        ),
+    )
+
+
+class ItemQueue(Base):
+    """Items still in play: a narrow row per item, so dispatch never touches the texts.
+
+    Labeled/skipped rows stay until bot.services.archive moves their final
+    state back to ``items``.
+    """
+
+    __tablename__ = "item_queue"
+
+    item_id: Mapped[int] = mapped_column(ForeignKey("items.id"), primary_key=True)
+    status: Mapped[str] = mapped_column(String(16), default="pending")
+    # Rated labels so far; the item stays pending until it reaches settings.label_overlap
+    label_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))  # copy of items.created_at
+    text_len: Mapped[int] = mapped_column(Integer)  # for BOT_BATCH_MAX_CHARS
+
+    __table_args__ = (
+        # Dispatch order for get_next_task, restricted to the dispatchable rows
+        Index(
+            "ix_item_queue_dispatch",
+            label_count.desc(),
+            created_at.desc(),
+            item_id.desc(),
+            postgresql_where=status == "pending",
+        ),
+        # Lock sweep and archiver; pending rows are covered by the dispatch index
+        Index("ix_item_queue_status", status, postgresql_where=status != "pending"),
+    )
+
 
 class Label(Base):
     __tablename__ = "labels"
@@ -56,3 +106,38 @@ class Label(Base):
 
     item: Mapped["Item"] = relationship(back_populates="labels")
     user: Mapped["User"] = relationship(back_populates="labels")
+
+    __table_args__ = (
+        Index("ix_labels_user_item", "user_id", "item_id"),
+        # Range scans of delta exports
+        Index("ix_labels_created_at", "created_at"),
+    )
+
+
+class ExportWatermark(Base):
+    """How far a named export has got; the next delta starts after ``exported_until``."""
+
+    __tablename__ = "export_watermarks"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    exported_until: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class LabelRollup(Base):
+    """Labels per user and hour, split by how long the item took to label."""
+
+    __tablename__ = "label_rollups"
+
+    user_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("users.telegram_id"), primary_key=True
+    )
+    hour: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    # Index into bot.services.rollups.DURATION_EDGES, -1 when the duration is unknown
+    duration_bin: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    rated: Mapped[int] = mapped_column(Integer, default=0)
+    skipped: Mapped[int] = mapped_column(Integer, default=0)
+
+    __table_args__ = (Index("ix_label_rollups_hour", "hour"),)
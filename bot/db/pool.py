@@ -0,0 +1,108 @@
+import logging
+import time
+from dataclasses import dataclass
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from bot.services.metrics import observe_pool_wait
+
+log = logging.getLogger(__name__)
+
+QUEUE_WARN_INTERVAL = 30  # seconds between "checkouts are queueing" warnings
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    queued: int = 0  # checkouts that found every connection (incl. overflow) in use
+    wait_seconds: float = 0.0  # total time spent in checkout
+    max_wait_seconds: float = 0.0
+
+
+@dataclass
+class PoolSnapshot:
+    size: int
+    checked_out: int
+    overflow: int
+    capacity: int  # size + max overflow
+    stats: PoolStats
+
+    @property
+    def utilization(self) -> float:
+        return self.checked_out / self.capacity if self.capacity else 0.0
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that times every checkout and warns when checkouts start queueing."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        self._queued_since_warning = 0
+        self._warned_at = 0.0
+
+    def _do_get(self):
+        queued = self.checkedout() >= self.size() + self._max_overflow
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.stats.checkouts += 1
+            self.stats.wait_seconds += waited
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+            observe_pool_wait(waited)
+            if queued:
+                self.stats.queued += 1
+                self._warn_queued(waited)
+
+    def _warn_queued(self, waited: float) -> None:
+        self._queued_since_warning += 1
+        now = time.monotonic()
+        if now - self._warned_at < QUEUE_WARN_INTERVAL:
+            return
+        log.warning(
+            "DB pool exhausted: %d checkout(s) queued since the last warning, last waited %.1f ms "
+            "(size=%d, max_overflow=%d); consider raising BOT_DB_POOL_SIZE",
+            self._queued_since_warning,
+            waited * 1000,
+            self.size(),
+            self._max_overflow,
+        )
+        self._queued_since_warning = 0
+        self._warned_at = now
+
+    def snapshot(self) -> PoolSnapshot:
+        return PoolSnapshot(
+            size=self.size(),
+            checked_out=self.checkedout(),
+            overflow=max(self.overflow(), 0),
+            capacity=self.size() + self._max_overflow,
+            stats=PoolStats(**vars(self.stats)),
+        )
+
+
+class PoolReporter:
+    """Logs pool utilization and checkout wait, per interval."""
+
+    def __init__(self, pool: InstrumentedPool) -> None:
+        self.pool = pool
+        self._last = PoolStats()
+
+    async def report(self) -> None:
+        snap = self.pool.snapshot()
+        checkouts = snap.stats.checkouts - self._last.checkouts
+        waited = snap.stats.wait_seconds - self._last.wait_seconds
+        queued = snap.stats.queued - self._last.queued
+        self._last = snap.stats
+        if not checkouts:
+            return
+        log.info(
+            "DB pool: %d/%d in use (%.0f%%), %d checkout(s), avg wait %.2f ms, %d queued",
+            snap.checked_out,
+            snap.capacity,
+            snap.utilization * 100,
+            checkouts,
+            waited / checkouts * 1000,
+            queued,
+        )
@@ -1,6 +1,32 @@
+from uuid import uuid4
+
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from bot.config import settings
+from bot.db.pool import InstrumentedPool
+
+
+def _connect_args() -> dict:
+    """asyncpg options; a zero cache size also makes statements safe behind pgbouncer."""
+    args: dict = {"prepared_statement_cache_size": settings.db_statement_cache_size}
+    if settings.db_statement_cache_size == 0:
+        # Transaction pooling hands each transaction a different server
+        # connection, so asyncpg's own cache must be off and every statement
+        # needs a name no other client connection can have prepared.
+        args["statement_cache_size"] = 0
+        args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    return args
+
 
-engine = create_async_engine(settings.database_url, echo=False)
+engine = create_async_engine(
+    settings.database_url,
+    echo=False,
+    poolclass=InstrumentedPool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    connect_args=_connect_args(),
+)
 sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
@@ -1,26 +1,75 @@
+import asyncio
+import html
 import io
 import logging
+import tempfile
+from collections.abc import Coroutine
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, TypeVar
 
 from aiogram import Bot, F, Router
 from aiogram.filters import Command, CommandObject
-from aiogram.types import BufferedInputFile, Message
-from sqlalchemy import func, select
+from aiogram.types import FSInputFile, Message
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from bot.db.models import Item, Label, User
-from bot.services.data import export_to_7z, import_from_7z
+from bot.db.models import User
+from bot.services.data import (
+    EXPORT_FORMATS,
+    IMPORT_SUFFIXES,
+    export_labels,
+    get_watermark,
+    import_dataset,
+    set_watermark,
+)
+from bot.services.outbound import BULK, outbound_priority
+from bot.services.rollups import get_labeler_speeds
+from bot.services.stats import read_stats, reconcile_stats
+from bot.services.user_cache import invalidate_users
 
 log = logging.getLogger(__name__)
 router = Router(name="admin")
 
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20 MB
 
+T = TypeVar("T")
+
+# Running import/export per admin, so /cancel can abort it
+_jobs: dict[int, asyncio.Task] = {}
+
+
+class JobCancelled(Exception):
+    pass
+
 
 def _require_admin(user: User) -> bool:
     return user.is_admin
 
 
-# ── Import: accept .7z document ──────────────────────────────────────
+async def _run_job(admin_id: int, coro: Coroutine[Any, Any, T]) -> T:
+    task = asyncio.create_task(coro)
+    _jobs[admin_id] = task
+    try:
+        await asyncio.wait({task})
+    finally:
+        _jobs.pop(admin_id, None)
+        task.cancel()  # no-op once done; stops the job if this handler is cancelled
+    if task.cancelled():
+        raise JobCancelled
+    return task.result()
+
+
+async def _import(session_factory: async_sessionmaker, path: Path):
+    async with session_factory() as session:
+        return await import_dataset(session, path)
+
+
+async def _export(session_factory: async_sessionmaker, dest_dir: Path, fmt: str, since: datetime | None):
+    async with session_factory() as session:
+        return await export_labels(session, dest_dir, fmt, since)
+
+
+# ── Import: accept .7z or data file document ─────────────────────────
 
 @router.message(F.document)
 async def handle_document(message: Message, bot: Bot, db_user: User, session_factory: async_sessionmaker) -> None:
@@ -29,38 +78,50 @@ async def handle_document(message: Message, bot: Bot, db_user: User, session_fac
         return
 
     doc = message.document
-    if not doc or not doc.file_name or not doc.file_name.endswith(".7z"):
-        await message.answer("Принимаются только файлы формата <b>.7z</b>.")
+    suffix = Path(doc.file_name).suffix.lower() if doc and doc.file_name else ""
+    if suffix not in IMPORT_SUFFIXES:
+        await message.answer(
+            "Принимаются архивы <b>.7z</b> и файлы <b>.parquet</b>, <b>.arrow</b>, <b>.ndjson</b>, <b>.csv</b>."
+        )
         return
 
     if doc.file_size and doc.file_size > MAX_FILE_SIZE:
         await message.answer(f"Файл слишком большой. Лимит: {MAX_FILE_SIZE // (1024 * 1024)} МБ.")
         return
 
-    status_msg = await message.answer("⏳ Обрабатываю архив…")
-
-    file = await bot.download(doc)
-    if file is None:
-        await status_msg.edit_text("Не удалось скачать файл.")
+    if db_user.telegram_id in _jobs:
+        await message.answer("Дождитесь окончания текущей операции или отмените её: /cancel")
         return
 
-    file_bytes = file.read()
+    status_msg = await message.answer("⏳ Обрабатываю файл… (/cancel — отменить)")
 
-    try:
-        async with session_factory() as session:
-            result = await import_from_7z(session, file_bytes)
-    except ValueError as e:
-        await status_msg.edit_text(f"Ошибка: {e}")
-        return
-    except Exception:
-        log.exception("Import error")
-        await status_msg.edit_text("Произошла ошибка при импорте.")
-        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        upload_path = Path(tmpdir) / f"upload{suffix}"
+        try:
+            await bot.download(doc, destination=upload_path)
+        except Exception:
+            log.exception("Download error")
+            await status_msg.edit_text("Не удалось скачать файл.")
+            return
+
+        try:
+            result = await _run_job(db_user.telegram_id, _import(session_factory, upload_path))
+        except JobCancelled:
+            await status_msg.edit_text("⏹ Импорт отменён.")
+            return
+        except ValueError as e:
+            await status_msg.edit_text(f"Ошибка: {e}")
+            return
+        except Exception:
+            log.exception("Import error")
+            await status_msg.edit_text("Произошла ошибка при импорте.")
+            return
 
     await status_msg.edit_text(
         f"✅ Импорт завершён.\n"
         f"Загружено: <b>{result.loaded}</b>\n"
-        f"Дубликатов: <b>{result.duplicates}</b>\n"
+        f"Дубликатов в файле: <b>{result.in_file_duplicates}</b>\n"
+        f"Уже в базе: <b>{result.db_duplicates}</b>\n"
         f"Ошибок: <b>{result.errors}</b>"
     )
 
@@ -68,30 +129,79 @@ async def handle_document(message: Message, bot: Bot, db_user: User, session_fac
 # ── Export ────────────────────────────────────────────────────────────
 
 @router.message(Command("export"))
-async def handle_export(message: Message, db_user: User, session_factory: async_sessionmaker) -> None:
+async def handle_export(
+    message: Message, command: CommandObject, db_user: User, session_factory: async_sessionmaker
+) -> None:
     if not _require_admin(db_user):
         await message.answer("Только администраторы могут экспортировать данные.")
         return
 
-    status_msg = await message.answer("⏳ Формирую экспорт…")
+    delta, fmt, watermark = False, "csv", f"admin:{db_user.telegram_id}"
+    for arg in (command.args or "").split():
+        if arg in ("full", "delta"):
+            delta = arg == "delta"
+        elif arg in EXPORT_FORMATS:
+            fmt = arg
+        elif len(arg) <= 64:
+            watermark = arg
+        else:
+            await message.answer("Имя метки не длиннее 64 символов.")
+            return
 
-    try:
+    if db_user.telegram_id in _jobs:
+        await message.answer("Дождитесь окончания текущей операции или отмените её: /cancel")
+        return
+
+    since = None
+    if delta:
         async with session_factory() as session:
-            archive_bytes = await export_to_7z(session)
-    except Exception:
-        log.exception("Export error")
-        await status_msg.edit_text("Произошла ошибка при экспорте.")
+            since = await get_watermark(session, watermark)
+
+    status_msg = await message.answer("⏳ Формирую экспорт… (/cancel — отменить)")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            export = await _run_job(db_user.telegram_id, _export(session_factory, Path(tmpdir), fmt, since))
+        except JobCancelled:
+            await status_msg.edit_text("⏹ Экспорт отменён.")
+            return
+        except Exception:
+            log.exception("Export error")
+            await status_msg.edit_text("Произошла ошибка при экспорте.")
+            return
+
+        if export is None:
+            await status_msg.edit_text(
+                "Новых оценок с прошлого экспорта нет." if since else "Нет размеченных данных для экспорта."
+            )
+            return
+
+        kind = f"новые оценки с {since:%d.%m.%Y %H:%M} UTC" if since else "полный снимок"
+        await status_msg.delete()
+        # A large upload must not hold up labelers' replies in the outbound queue
+        with outbound_priority(BULK):
+            await message.answer_document(
+                FSInputFile(export.path, filename=export.path.name),
+                caption=f"📦 Экспорт завершён: {export.rows} оценок ({kind}).\nМетка: <code>{html.escape(watermark)}</code>",
+            )
+
+    # Only after delivery, so a failed upload is exported again next time
+    async with session_factory() as session:
+        await set_watermark(session, watermark, export.until)
+
+
+@router.message(Command("cancel"))
+async def handle_cancel(message: Message, db_user: User) -> None:
+    if not _require_admin(db_user):
+        await message.answer("Только администраторы могут использовать эту команду.")
         return
 
-    if archive_bytes is None:
-        await status_msg.edit_text("Нет размеченных данных для экспорта.")
+    task = _jobs.get(db_user.telegram_id)
+    if task is None:
+        await message.answer("Нет выполняющегося импорта или экспорта.")
         return
 
-    await status_msg.delete()
-    await message.answer_document(
-        BufferedInputFile(archive_bytes, filename="dataset_export.7z"),
-        caption="📦 Экспорт завершён.",
-    )
+    task.cancel()
 
 
 # ── Admin management ─────────────────────────────────────────────────
@@ -110,7 +220,8 @@ async def handle_admin_command(
             "Использование:\n"
             "/admin user add <user_id>\n"
             "/admin admin add <user_id>\n"
-            "/admin stats"
+            "/admin stats\n"
+            "/admin speed"
         )
         return
 
@@ -120,6 +231,10 @@ async def handle_admin_command(
         await _show_global_stats(message, session_factory)
         return
 
+    if parts[0] == "speed":
+        await _show_labeler_speed(message, session_factory)
+        return
+
     if len(parts) == 3 and parts[1] == "add":
         role = parts[0]  # "user" or "admin"
         try:
@@ -137,6 +252,7 @@ async def handle_admin_command(
                 if role == "admin":
                     user.is_admin = True
             await session.commit()
+        await invalidate_users(target_id)
 
         label = "администратор" if role == "admin" else "пользователь"
         await message.answer(f"✅ {label.capitalize()} <code>{target_id}</code> добавлен.")
@@ -146,37 +262,39 @@ async def handle_admin_command(
 
 
 async def _show_global_stats(message: Message, session_factory: async_sessionmaker) -> None:
-    async with session_factory() as session:
-        total = (await session.execute(select(func.count(Item.id)))).scalar() or 0
-        labeled = (
-            await session.execute(select(func.count(Item.id)).where(Item.status == "labeled"))
-        ).scalar() or 0
-        remaining = (
-            await session.execute(
-                select(func.count(Item.id)).where(Item.status.in_(["pending", "locked"]))
-            )
-        ).scalar() or 0
-
-        per_user = (
-            await session.execute(
-                select(
-                    Label.user_id,
-                    func.count(Label.item_id).label("cnt"),
-                )
-                .where(Label.action == "rated")
-                .group_by(Label.user_id)
-            )
-        ).all()
+    stats = await read_stats()
+    if stats is None:
+        # Counters not built yet (fresh Redis); the recount also stores them
+        async with session_factory() as session:
+            stats = await reconcile_stats(session)
 
     lines = [
         f"📊 <b>Глобальная статистика</b>\n",
-        f"Всего записей: <b>{total}</b>",
-        f"Размечено: <b>{labeled}</b>",
-        f"Осталось: <b>{remaining}</b>",
+        f"Всего записей: <b>{stats.total}</b>",
+        f"Размечено: <b>{stats.by_status['labeled']}</b>",
+        f"Осталось: <b>{stats.remaining}</b>",
     ]
-    if per_user:
+    if stats.rated_by_user:
         lines.append("\n<b>По пользователям:</b>")
-        for uid, cnt in per_user:
+        for uid, cnt in stats.rated_by_user.items():
             lines.append(f"  • <code>{uid}</code>: {cnt}")
 
     await message.answer("\n".join(lines))
+
+
+async def _show_labeler_speed(message: Message, session_factory: async_sessionmaker) -> None:
+    async with session_factory() as session:
+        speeds = await get_labeler_speeds(session, timedelta(days=1))
+
+    if not speeds:
+        await message.answer("За последние сутки разметки не было.")
+        return
+
+    lines = ["⏱ <b>Скорость разметчиков за сутки</b>\n"]
+    for s in speeds:
+        median = f"{s.median_seconds:.1f} с" if s.median_seconds is not None else "—"
+        lines.append(
+            f"  • <code>{s.user_id}</code>: {s.items} шт., {s.per_hour:.0f}/ч, медиана {median}"
+        )
+
+    await message.answer("\n".join(lines))
@@ -1,15 +1,21 @@
+import asyncio
 import logging
+from datetime import datetime, timezone
 
 from aiogram import Bot, Router
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from aiogram.filters import Command
-from aiogram.types import CallbackQuery, Message
-from sqlalchemy import func, select
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from bot.db.models import Label, User
-from bot.keyboards import LabelCB, get_labeling_keyboard
-from bot.services.items import complete_task, get_next_task
+from bot.config import settings
+from bot.db.models import Item, User
+from bot.keyboards import BatchCB, LabelCB, get_batch_keyboard, get_labeling_keyboard
+from bot.services.batch import claim_batch, get_batch, save_batch, score_batch_item, submit_batch
+from bot.services.items import AlreadyLabeled, complete_task, get_next_task, schedule_refill
 from bot.services.lock import get_user_current, set_user_current
+from bot.services.rollups import get_labeler_stats
 
 log = logging.getLogger(__name__)
 router = Router(name="labeling")
@@ -19,24 +25,107 @@ async def _send_task(
     bot: Bot, chat_id: int, user_id: int, session_factory: async_sessionmaker
 ) -> None:
     async with session_factory() as session:
-        item = await get_next_task(session, user_id)
+        batch = await claim_batch(session, user_id)
+        item = None if batch else await get_next_task(session, user_id)
 
-    if item is None:
-        await bot.send_message(chat_id, "Задач пока нет, возвращайтесь позже.")
+    await _show_next(bot, chat_id, user_id, batch, item, session_factory)
+
+
+async def _show_next(
+    bot: Bot,
+    chat_id: int,
+    user_id: int,
+    batch: list[Item],
+    item: Item | None,
+    session_factory: async_sessionmaker,
+    edit_message_id: int | None = None,
+) -> None:
+    """Show the claimed batch, or else the single task."""
+    if batch:
+        await _show_batch(bot, chat_id, user_id, batch, edit_message_id=edit_message_id)
         return
 
-    msg = await bot.send_message(
-        chat_id,
-        f"📝 <b>Оцените текст (0-10):</b>\n\n{item.text}",
-        reply_markup=get_labeling_keyboard(item.id),
-    )
-    await set_user_current(user_id, item.id, msg.message_id)
+    # Top up the prefetch buffer while the message is on its way
+    schedule_refill(session_factory, user_id)
+
+    await _show_task(bot, chat_id, user_id, item, edit_message_id=edit_message_id)
+
+
+async def _show_task(
+    bot: Bot, chat_id: int, user_id: int, item: Item | None, edit_message_id: int | None = None
+) -> None:
+    """Show the task, in place of ``edit_message_id`` when given, else as a new message."""
+    if item is None:
+        text, markup = "Задач пока нет, возвращайтесь позже.", None
+    else:
+        text, markup = f"📝 <b>Оцените текст (0-10):</b>\n\n{item.text}", get_labeling_keyboard(item.id)
+
+    message_id = await _send_or_edit(bot, chat_id, text, markup, edit_message_id)
+
+    if item is not None:
+        await set_user_current(user_id, item.id, message_id)
+
+
+async def _show_batch(
+    bot: Bot,
+    chat_id: int,
+    user_id: int,
+    items: list[Item],
+    scores: dict[int, int] | None = None,
+    edit_message_id: int | None = None,
+) -> None:
+    """Show several short items in one message with a score block per item."""
+    texts = "\n\n".join(f"<b>{n}.</b> {item.text}" for n, item in enumerate(items, 1))
+    text = f"📝 <b>Оцените тексты (0-10) и нажмите «Отправить»:</b>\n\n{texts}"
+    item_ids = [item.id for item in items]
+    markup = get_batch_keyboard(item_ids, scores or {})
+
+    message_id = await _send_or_edit(bot, chat_id, text, markup, edit_message_id)
+    await save_batch(user_id, item_ids, message_id, scores)
+
+
+async def _send_or_edit(
+    bot: Bot, chat_id: int, text: str, markup: InlineKeyboardMarkup | None, edit_message_id: int | None
+) -> int:
+    if edit_message_id is not None:
+        try:
+            await bot.edit_message_text(text, chat_id=chat_id, message_id=edit_message_id, reply_markup=markup)
+            return edit_message_id
+        except TelegramBadRequest as e:
+            log.warning("Could not edit message %d, sending a new one: %s", edit_message_id, e.message)
+
+    return (await bot.send_message(chat_id, text, reply_markup=markup)).message_id
+
+
+async def _answer(callback: CallbackQuery, text: str | None = None) -> None:
+    try:
+        await callback.answer(text)
+    except TelegramAPIError as e:
+        log.warning("Could not answer callback %s: %s", callback.id, e.message)
 
 
 @router.message(Command("start"))
 async def handle_start(
     message: Message, bot: Bot, db_user: User, session_factory: async_sessionmaker
 ) -> None:
+    # Re-show an open batch as a new message, keeping the scores given so far
+    batch = await get_batch(db_user.telegram_id)
+    if batch is not None:
+        try:
+            await bot.delete_message(message.chat.id, batch.message_id)
+        except Exception:
+            pass
+
+        async with session_factory() as session:
+            found = {
+                item.id: item
+                for item in (await session.scalars(select(Item).where(Item.id.in_(batch.item_ids)))).all()
+            }
+        items = [found[item_id] for item_id in batch.item_ids if item_id in found]
+        if items:
+            await _show_batch(bot, message.chat.id, db_user.telegram_id, items, batch.scores)
+            return
+
     # Check if user already has an active task
     current_item_id, current_msg_id = await get_user_current(db_user.telegram_id)
     if current_item_id is not None:
@@ -48,16 +137,10 @@ async def handle_start(
                 pass
 
         async with session_factory() as session:
-            from bot.db.models import Item
-
             item = await session.get(Item, current_item_id)
 
         if item is not None:
-            msg = await message.answer(
-                f"📝 <b>Оцените текст (0-10):</b>\n\n{item.text}",
-                reply_markup=get_labeling_keyboard(item.id),
-            )
-            await set_user_current(db_user.telegram_id, item.id, msg.message_id)
+            await _show_task(bot, message.chat.id, db_user.telegram_id, item)
             return
 
     await _send_task(bot, message.chat.id, db_user.telegram_id, session_factory)
@@ -71,22 +154,69 @@ async def handle_label_callback(
     db_user: User,
     session_factory: async_sessionmaker,
 ) -> None:
-    await callback.answer()
+    # Stop the button spinner while the label is stored
+    answered = asyncio.create_task(_answer(callback))
+    try:
+        await _rotate_task(callback, callback_data, bot, db_user, session_factory)
+    finally:
+        await answered
 
+
+async def _rotate_task(
+    callback: CallbackQuery,
+    callback_data: LabelCB,
+    bot: Bot,
+    db_user: User,
+    session_factory: async_sessionmaker,
+) -> None:
     action = "rated" if callback_data.action == "rate" else "skipped"
     score = callback_data.score if action == "rated" else None
 
+    # Time on the item: from when the task message was shown until this press
+    seconds = None
+    if isinstance(callback.message, Message):
+        shown_at = callback.message.edit_date or callback.message.date
+        seconds = (datetime.now(timezone.utc) - shown_at).total_seconds()
+
     try:
         async with session_factory() as session:
             await complete_task(
-                session, callback_data.item_id, db_user.telegram_id, score, action
+                session, callback_data.item_id, db_user.telegram_id, score, action, seconds
             )
+            batch = await claim_batch(session, db_user.telegram_id)
+            item = None if batch else await get_next_task(session, db_user.telegram_id)
+    except AlreadyLabeled:
+        return  # repeated press on a task that is already recorded
     except Exception:
         log.exception("Error completing task item_id=%d", callback_data.item_id)
         await callback.message.edit_text("Произошла ошибка. Попробуйте /start.")  # type: ignore[union-attr]
         return
 
-    # Delete the labeling message
+    await _replace_message(callback, bot, db_user, batch, item, session_factory)
+
+
+async def _replace_message(
+    callback: CallbackQuery,
+    bot: Bot,
+    db_user: User,
+    batch: list[Item],
+    item: Item | None,
+    session_factory: async_sessionmaker,
+) -> None:
+    """Show what comes next in place of the message whose button was pressed."""
+    if settings.edit_in_place and isinstance(callback.message, Message):
+        # One API call: the same message now shows the next item
+        await _show_next(
+            bot,
+            callback.from_user.id,
+            db_user.telegram_id,
+            batch,
+            item,
+            session_factory,
+            edit_message_id=callback.message.message_id,
+        )
+        return
+
     try:
         await callback.message.delete()  # type: ignore[union-attr]
     except Exception:
@@ -95,8 +225,66 @@ async def handle_label_callback(
             callback.message.message_id if callback.message else "?",
         )
 
-    # Send next task immediately
-    await _send_task(bot, callback.from_user.id, db_user.telegram_id, session_factory)
+    await _show_next(bot, callback.from_user.id, db_user.telegram_id, batch, item, session_factory)
+
+
+# ── Batch mode ────────────────────────────────────────────────────────
+
+
+@router.callback_query(BatchCB.filter())
+async def handle_batch_callback(
+    callback: CallbackQuery,
+    callback_data: BatchCB,
+    bot: Bot,
+    db_user: User,
+    session_factory: async_sessionmaker,
+) -> None:
+    if callback_data.action == "noop":
+        await _answer(callback)
+        return
+
+    if callback_data.action == "rate":
+        batch = await score_batch_item(db_user.telegram_id, callback_data.item_id, callback_data.score)
+        if batch is None:
+            await _answer(callback, "Эта пачка уже отправлена.")
+            return
+        answered = asyncio.create_task(_answer(callback))
+        try:
+            await callback.message.edit_reply_markup(  # type: ignore[union-attr]
+                reply_markup=get_batch_keyboard(batch.item_ids, batch.scores)
+            )
+        except TelegramBadRequest:
+            pass  # the same score pressed again: message is not modified
+        finally:
+            await answered
+        return
+
+    # A repeated press must not submit the batch that replaced this one in the same message
+    batch = await get_batch(db_user.telegram_id)
+    if (
+        batch is None
+        or not isinstance(callback.message, Message)
+        or batch.message_id != callback.message.message_id
+        or batch.item_ids[0] != callback_data.item_id
+    ):
+        await _answer(callback, "Эта пачка уже отправлена.")
+        return
+
+    answered = asyncio.create_task(_answer(callback))
+    try:
+        try:
+            async with session_factory() as session:
+                await submit_batch(session, db_user.telegram_id, batch)
+                next_batch = await claim_batch(session, db_user.telegram_id)
+                item = None if next_batch else await get_next_task(session, db_user.telegram_id)
+        except Exception:
+            log.exception("Error submitting batch of user_id=%d", db_user.telegram_id)
+            await callback.message.edit_text("Произошла ошибка. Попробуйте /start.")
+            return
+
+        await _replace_message(callback, bot, db_user, next_batch, item, session_factory)
+    finally:
+        await answered
 
 
 # ── Personal stats ────────────────────────────────────────────────────
@@ -107,32 +295,16 @@ async def handle_stats(
     message: Message, db_user: User, session_factory: async_sessionmaker
 ) -> None:
     async with session_factory() as session:
-        rated_count = (
-            await session.execute(
-                select(func.count(Label.item_id)).where(
-                    Label.user_id == db_user.telegram_id, Label.action == "rated"
-                )
-            )
-        ).scalar() or 0
-
-        skipped_count = (
-            await session.execute(
-                select(func.count(Label.item_id)).where(
-                    Label.user_id == db_user.telegram_id, Label.action == "skipped"
-                )
-            )
-        ).scalar() or 0
+        stats = await get_labeler_stats(session, db_user.telegram_id)
 
-        avg_time = (
-            await session.execute(
-                select(func.avg(func.extract("epoch", Label.created_at))).where(
-                    Label.user_id == db_user.telegram_id, Label.action == "rated"
-                )
-            )
-        ).scalar()
+    lines = [
+        "📊 <b>Ваша статистика</b>\n",
+        f"Размечено: <b>{stats.rated}</b>",
+        f"Пропущено: <b>{stats.skipped}</b>",
+        f"За текущий час: <b>{stats.last_hour}</b>",
+        f"За сутки: <b>{stats.last_day}</b>",
+    ]
+    if stats.median_seconds is not None:
+        lines.append(f"Медиана на задачу: <b>{stats.median_seconds:.1f} с</b>")
 
-    await message.answer(
-        f"📊 <b>Ваша статистика</b>\n\n"
-        f"Размечено: <b>{rated_count}</b>\n"
-        f"Пропущено: <b>{skipped_count}</b>"
-    )
+    await message.answer("\n".join(lines))
@@ -8,6 +8,12 @@ class LabelCB(CallbackData, prefix="lbl"):
     item_id: int
 
 
+class BatchCB(CallbackData, prefix="bat"):
+    action: str  # "rate", "submit" or "noop" (item number)
+    item_id: int = 0  # for "submit", the first item of the batch
+    score: int = 0
+
+
 # Red → Orange → Yellow → Green gradient
 _SCORE_EMOJI = ["🟢", "🟢", "🟢", "🟢", "🟡", "🟡", "🟡", "🟠", "🟠", "🔴", "🔴"]
 
@@ -35,3 +41,37 @@ def get_labeling_keyboard(item_id: int) -> InlineKeyboardMarkup:
     ]
 
     return InlineKeyboardMarkup(inline_keyboard=[row1, row2, row3])
+
+
+_KEYCAPS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣"]
+
+
+def get_batch_keyboard(item_ids: list[int], scores: dict[int, int]) -> InlineKeyboardMarkup:
+    """Two score rows per item, numbered as in the message, and a submit button.
+
+    12 buttons per item, so 8 items stay under Telegram's 100-button limit.
+    """
+
+    def score_button(item_id: int, score: int) -> InlineKeyboardButton:
+        text = f"✅{score}" if scores.get(item_id) == score else str(score)
+        return InlineKeyboardButton(
+            text=text, callback_data=BatchCB(action="rate", item_id=item_id, score=score).pack()
+        )
+
+    rows = []
+    for n, item_id in enumerate(item_ids):
+        number = InlineKeyboardButton(
+            text=_KEYCAPS[n], callback_data=BatchCB(action="noop", item_id=item_id).pack()
+        )
+        rows.append([number] + [score_button(item_id, i) for i in range(6)])
+        rows.append([score_button(item_id, i) for i in range(6, 11)])
+
+    rows.append(
+        [
+            InlineKeyboardButton(
+                text=f"📨 Отправить ({len(scores)}/{len(item_ids)})",
+                callback_data=BatchCB(action="submit", item_id=item_ids[0]).pack(),
+            )
+        ]
+    )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
@@ -3,10 +3,10 @@ from typing import Any, Awaitable, Callable
 
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Update
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.db.models import User
+from bot.services.user_cache import MISS, user_cache
 
 log = logging.getLogger(__name__)
 
@@ -32,8 +32,11 @@ class AuthMiddleware(BaseMiddleware):
         if user_tg is None:
             return
 
-        async with self.session_factory() as session:
-            user = await session.get(User, user_tg.id)
+        user = user_cache.get(user_tg.id)
+        if user is MISS:
+            async with self.session_factory() as session:
+                user = await session.get(User, user_tg.id)
+            user_cache.put(user_tg.id, user)
 
         if user is None:
             log.warning("Unauthorized access attempt: user_id=%d", user_tg.id)
@@ -0,0 +1,70 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from bot.services import metrics
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: the whole update, auth included."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        update: Update = event  # type: ignore[assignment]
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.UPDATE_SECONDS.labels(update.event_type).observe(time.perf_counter() - started)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: time spent in the handler that matched.
+
+    Register it after ``UserSequencerMiddleware`` so waiting for the user's turn is not counted.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            router = data["event_router"].name
+            callback = data["handler"].callback
+            metrics.HANDLER_SECONDS.labels(router, callback.__name__).observe(time.perf_counter() - started)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware: Bot API latency and errors per method, per attempt.
+
+    Register it after ``OutboundScheduler`` so rate-limit waits are not counted.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.BOT_API_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            metrics.BOT_API_SECONDS.labels(name).observe(time.perf_counter() - started)
@@ -0,0 +1,49 @@
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.services.lock import user_turn
+
+
+class UserSequencerMiddleware(BaseMiddleware):
+    """Handle one update per user at a time, in update order.
+
+    Within a process a per-user ``asyncio.Lock`` (FIFO for its waiters) keeps
+    arrival order, which is update order when updates come from polling. With
+    ``distributed`` set, updates are queued per user in Redis by update_id
+    instead, so replicas behind a load balancer take the user's turn in order.
+    """
+
+    def __init__(self, distributed: bool = False) -> None:
+        self.distributed = distributed
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._queued: Counter[int] = Counter()  # updates waiting or running, per user
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        if self.distributed:
+            update = data["event_update"]
+            async with user_turn(user.id, update.update_id):
+                return await handler(event, data)
+
+        lock = self._locks.setdefault(user.id, asyncio.Lock())
+        self._queued[user.id] += 1
+        try:
+            async with lock:
+                return await handler(event, data)
+        finally:
+            self._queued[user.id] -= 1
+            if not self._queued[user.id]:
+                del self._queued[user.id]
+                del self._locks[user.id]
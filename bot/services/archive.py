@@ -0,0 +1,56 @@
+import logging
+import time
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.db.models import Item, ItemQueue
+from bot.services.metrics import observe_job
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_INTERVAL = 60  # seconds between archive_items runs
+ARCHIVE_BATCH = 5_000  # items moved per transaction
+
+DONE_STATUSES = ("labeled", "skipped")
+
+
+async def archive_done_items(session: AsyncSession, limit: int = ARCHIVE_BATCH) -> int:
+    """Move up to ``limit`` finished items out of item_queue, writing their final state to items."""
+    picked = (
+        select(ItemQueue.item_id)
+        .where(ItemQueue.status.in_(DONE_STATUSES))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    moved = (
+        delete(ItemQueue)
+        .where(ItemQueue.item_id.in_(picked.scalar_subquery()))
+        .returning(ItemQueue.item_id, ItemQueue.status, ItemQueue.label_count)
+        .cte("moved")
+    )
+    result = await session.execute(
+        update(Item)
+        .where(Item.id == moved.c.item_id)
+        .values(status=moved.c.status, label_count=moved.c.label_count)
+    )
+    await session.commit()
+    return result.rowcount  # type: ignore[union-attr]
+
+
+async def archive_items(session_factory: async_sessionmaker) -> None:
+    """Drain finished items in batches, so the queue stays the size of the open work.
+
+    Statuses do not change on the way, so the stats counters are left alone.
+    """
+    started = time.perf_counter()
+    total = 0
+    while True:
+        async with session_factory() as session:
+            moved = await archive_done_items(session)
+        total += moved
+        if moved < ARCHIVE_BATCH:
+            break
+    if total:
+        observe_job("archive", time.perf_counter() - started, total)
+        log.info("Archived %d finished item(s) in %.1fs", total, time.perf_counter() - started)
@@ -0,0 +1,114 @@
+import logging
+import time
+from dataclasses import dataclass
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.db.models import Item
+from bot.services.items import Completion, claim_items, record_completions
+from bot.services.lock import get_lock_owners, release_item_locks, renew_item_locks
+from bot.services.redis import redis
+
+log = logging.getLogger(__name__)
+
+# hash: msg -> message id, shown -> unix time, items -> "id,id,…", score:<id> -> score
+BATCH_PREFIX = "user:batch:"
+MAX_BATCH = 8  # 12 buttons per item + submit, Telegram allows 100 per keyboard
+TEXT_LIMIT = 4000  # Telegram's 4096, minus the header
+ITEM_OVERHEAD = 16  # number and blank line around each text
+
+
+@dataclass
+class Batch:
+    message_id: int
+    shown_at: float  # unix time the message was sent
+    item_ids: list[int]
+    scores: dict[int, int]  # item id -> score, for the items scored so far
+
+
+def batch_capacity() -> int:
+    """Items per batch message: the setting, capped by Telegram's keyboard and text limits."""
+    fits = TEXT_LIMIT // (settings.batch_max_chars + ITEM_OVERHEAD)
+    return max(0, min(settings.batch_size, MAX_BATCH, fits))
+
+
+async def claim_batch(session: AsyncSession, user_id: int) -> list[Item]:
+    """Claim up to ``batch_capacity()`` short items in one dispatch query; [] if batching is off."""
+    if batch_capacity() < 2:
+        return []
+    return await claim_items(session, user_id, batch_capacity(), max_chars=settings.batch_max_chars)
+
+
+async def save_batch(
+    user_id: int, item_ids: list[int], message_id: int, scores: dict[int, int] | None = None
+) -> None:
+    key = f"{BATCH_PREFIX}{user_id}"
+    mapping = {"msg": message_id, "shown": time.time(), "items": ",".join(map(str, item_ids))}
+    mapping.update({f"score:{item_id}": score for item_id, score in (scores or {}).items()})
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, settings.lock_ttl_seconds)
+        await pipe.execute()
+
+
+async def get_batch(user_id: int) -> Batch | None:
+    raw = await redis.hgetall(f"{BATCH_PREFIX}{user_id}")
+    if not raw.get("items"):
+        return None
+    return Batch(
+        message_id=int(raw["msg"]),
+        shown_at=float(raw["shown"]),
+        item_ids=[int(v) for v in raw["items"].split(",")],
+        scores={int(k[6:]): int(v) for k, v in raw.items() if k.startswith("score:")},
+    )
+
+
+async def score_batch_item(user_id: int, item_id: int, score: int) -> Batch | None:
+    """Record a score in the user's open batch and extend its leases; ``None`` if no batch has the item.
+
+    Updates of one user are handled one at a time, so read-modify-write is safe here.
+    """
+    batch = await get_batch(user_id)
+    if batch is None or item_id not in batch.item_ids:
+        return None
+    batch.scores[item_id] = score
+
+    key = f"{BATCH_PREFIX}{user_id}"
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(key, f"score:{item_id}", score)
+        pipe.expire(key, settings.lock_ttl_seconds)
+        await pipe.execute()
+    await renew_item_locks(batch.item_ids)
+    return batch
+
+
+async def clear_batch(user_id: int) -> None:
+    await redis.delete(f"{BATCH_PREFIX}{user_id}")
+
+
+async def submit_batch(session: AsyncSession, user_id: int, batch: Batch) -> int:
+    """Store the whole batch in one transaction; unscored items count as skipped.
+
+    The time on the message is split evenly across its items. Returns the
+    number of new labels.
+    """
+    per_item = (time.time() - batch.shown_at) / len(batch.item_ids)
+    completions = [
+        Completion(
+            item_id=item_id,
+            user_id=user_id,
+            score=batch.scores.get(item_id),
+            action="rated" if item_id in batch.scores else "skipped",
+            seconds=per_item,
+        )
+        for item_id in batch.item_ids
+    ]
+    created = await record_completions(session, completions)
+    await clear_batch(user_id)
+
+    # Leases that lapsed may belong to someone else by now
+    owners = await get_lock_owners(batch.item_ids)
+    await release_item_locks([i for i, owner in zip(batch.item_ids, owners) if owner == user_id])
+    return sum(created)
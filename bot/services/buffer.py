@@ -0,0 +1,72 @@
+import logging
+import time
+
+from bot.config import settings
+from bot.services.lock import LOCK_PREFIX, STATE_PREFIX
+from bot.services.redis import redis
+
+log = logging.getLogger(__name__)
+
+BUFFER_PREFIX = "user:buffer:"
+ACTIVE_KEY = "buffer:active"  # zset: user_id -> last activity timestamp
+
+# Pop buffered items until one whose lease the user still holds, renew that lease
+# and make it the current task. Lock keys are derived in the script, so this
+# assumes a single Redis node rather than Cluster.
+# KEYS: buffer, user state, active zset. ARGV: user_id, ttl, now, lock prefix
+_POP = redis.register_script(
+    """
+    redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+    while true do
+        local item = redis.call('LPOP', KEYS[1])
+        if not item then
+            return false
+        end
+        local lock = ARGV[4] .. item
+        if redis.call('GET', lock) == ARGV[1] then
+            redis.call('EXPIRE', lock, ARGV[2])
+            redis.call('HSET', KEYS[2], 'item', item)
+            redis.call('HDEL', KEYS[2], 'msg')
+            return tonumber(item)
+        end
+    end
+    """
+)
+
+
+async def push_buffer(user_id: int, item_ids: list[int]) -> None:
+    key = f"{BUFFER_PREFIX}{user_id}"
+    async with redis.pipeline(transaction=False) as pipe:
+        if item_ids:
+            pipe.rpush(key, *item_ids)
+        pipe.expire(key, settings.lock_ttl_seconds)
+        pipe.zadd(ACTIVE_KEY, {str(user_id): time.time()})
+        await pipe.execute()
+
+
+async def pop_buffer(user_id: int) -> int | None:
+    """Take the next still-leased item off the buffer as the user's current task."""
+    item_id = await _POP(
+        keys=[f"{BUFFER_PREFIX}{user_id}", f"{STATE_PREFIX}{user_id}", ACTIVE_KEY],
+        args=[user_id, settings.lock_ttl_seconds, time.time(), LOCK_PREFIX],
+    )
+    return int(item_id) if item_id is not None else None
+
+
+async def get_buffer(user_id: int) -> list[int]:
+    return [int(v) for v in await redis.lrange(f"{BUFFER_PREFIX}{user_id}", 0, -1)]
+
+
+async def drain_buffer(user_id: int) -> list[int]:
+    key = f"{BUFFER_PREFIX}{user_id}"
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        pipe.zrem(ACTIVE_KEY, str(user_id))
+        values, _, _ = await pipe.execute()
+    return [int(v) for v in values]
+
+
+async def idle_buffer_users(idle_seconds: int) -> list[int]:
+    users = await redis.zrangebyscore(ACTIVE_KEY, 0, time.time() - idle_seconds)
+    return [int(u) for u in users]
@@ -1,38 +1,157 @@
 import asyncio
 import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
 
-from sqlalchemy import select, update
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from redis.exceptions import ResponseError
+from sqlalchemy import any_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from bot.db.models import Item
+from bot.config import settings
+from bot.db.models import ItemQueue
+from bot.services.buffer import idle_buffer_users
+from bot.services.items import release_buffer
 from bot.services.lock import LOCK_PREFIX
 from bot.services.redis import redis
+from bot.services.stats import move_items
 
 log = logging.getLogger(__name__)
 
-CLEANUP_INTERVAL = 60  # seconds
+CLEANUP_INTERVAL = 60  # seconds between cleanup_stale_locks runs
+SWEEP_BATCH = 1_000  # EXISTS calls per Redis pipeline
+EXPIRY_FLUSH_INTERVAL = 0.5  # seconds to collect expiry events before one UPDATE
+EXPIRY_FLUSH_SIZE = 500
+RECONNECT_DELAY = 5  # seconds
+
+
+@dataclass
+class ReclaimReport:
+    source: str  # "sweep" or "expiry"
+    checked: int
+    reclaimed: int
+    duration: float  # seconds
+
+
+async def reclaim_items(session: AsyncSession, item_ids: list[int]) -> int:
+    """Put items back to 'pending' in one statement; items no longer locked are left alone."""
+    if not item_ids:
+        return 0
+    result = await session.execute(
+        update(ItemQueue)
+        .where(ItemQueue.item_id == any_(item_ids), ItemQueue.status == "locked")
+        .values(status="pending")
+    )
+    await session.commit()
+    reclaimed = result.rowcount  # type: ignore[union-attr]
+    await move_items(Counter({("locked", "pending"): reclaimed}))
+    return reclaimed
+
+
+async def sweep_stale_locks(session_factory: async_sessionmaker) -> ReclaimReport:
+    """Reset every 'locked' item whose Redis lock is gone, checking locks in pipelined batches."""
+    started = time.perf_counter()
+    async with session_factory() as session:
+        locked_items = (
+            await session.execute(select(ItemQueue.item_id).where(ItemQueue.status == "locked"))
+        ).scalars().all()
+
+        stale: list[int] = []
+        for i in range(0, len(locked_items), SWEEP_BATCH):
+            batch = locked_items[i : i + SWEEP_BATCH]
+            async with redis.pipeline(transaction=False) as pipe:
+                for item_id in batch:
+                    pipe.exists(f"{LOCK_PREFIX}{item_id}")
+                exists = await pipe.execute()
+            stale.extend(item_id for item_id, found in zip(batch, exists) if not found)
+
+        reclaimed = await reclaim_items(session, stale)
+
+    return ReclaimReport("sweep", len(locked_items), reclaimed, time.perf_counter() - started)
 
 
 async def cleanup_stale_locks(session_factory: async_sessionmaker) -> None:
-    """Reset items stuck in 'locked' status whose Redis lock has expired."""
+    """Safety-net sweep for locks whose expiry event was missed (e.g. while disconnected)."""
+    report = await sweep_stale_locks(session_factory)
+    _log_report(report)
+
+    if settings.prefetch_size > 0:
+        await release_idle_buffers(session_factory)
+
+
+async def watch_lock_expiry(session_factory: async_sessionmaker) -> None:
+    """Reclaim items as soon as Redis reports their lock key expired."""
+    db = redis.connection_pool.connection_kwargs.get("db", 0)
+    channel = f"__keyevent@{db}__:expired"
+
     while True:
         try:
-            async with session_factory() as session:
-                locked_items = (
-                    await session.execute(select(Item.id).where(Item.status == "locked"))
-                ).scalars().all()
-
-                for item_id in locked_items:
-                    key = f"{LOCK_PREFIX}{item_id}"
-                    exists = await redis.exists(key)
-                    if not exists:
-                        await session.execute(
-                            update(Item).where(Item.id == item_id).values(status="pending")
-                        )
-                        log.info("Reset stale lock for item_id=%d", item_id)
-
-                await session.commit()
+            await _enable_expiry_events()
+            async with redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(channel)
+                log.info("Listening for lock expiry on %s", channel)
+                await _consume_expiry_events(pubsub, session_factory)
+        except asyncio.CancelledError:
+            raise
         except Exception:
-            log.exception("Error in cleanup task")
+            log.exception("Lock expiry listener failed, reconnecting")
+        await asyncio.sleep(RECONNECT_DELAY)
+
+
+async def _enable_expiry_events() -> None:
+    # Keep whatever flags are already configured and add E (keyevent) + x (expired)
+    try:
+        config = await redis.config_get("notify-keyspace-events")
+    except ResponseError:
+        config = {}
+    current = config.get("notify-keyspace-events", "")
+    if "x" in current and ("E" in current or "A" in current):
+        return
+    flags = "".join(sorted(set(current) | {"E", "x"}))
+    try:
+        await redis.config_set("notify-keyspace-events", flags)
+    except ResponseError:
+        # Managed Redis often forbids CONFIG; the sweep still covers us
+        log.warning("Could not enable keyspace notifications, set notify-keyspace-events=Ex manually")
+
+
+async def _consume_expiry_events(pubsub, session_factory: async_sessionmaker) -> None:
+    pending: list[int] = []
+    deadline = time.monotonic() + EXPIRY_FLUSH_INTERVAL
+
+    while True:
+        timeout = max(deadline - time.monotonic(), 0) if pending else None
+        message = await pubsub.get_message(timeout=timeout)
+        if message is not None:
+            key = message["data"]
+            if isinstance(key, str) and key.startswith(LOCK_PREFIX):
+                if not pending:
+                    deadline = time.monotonic() + EXPIRY_FLUSH_INTERVAL
+                pending.append(int(key.removeprefix(LOCK_PREFIX)))
+
+        if pending and (len(pending) >= EXPIRY_FLUSH_SIZE or time.monotonic() >= deadline):
+            started = time.perf_counter()
+            async with session_factory() as session:
+                reclaimed = await reclaim_items(session, pending)
+            _log_report(ReclaimReport("expiry", len(pending), reclaimed, time.perf_counter() - started))
+            pending = []
+
+
+def _log_report(report: ReclaimReport) -> None:
+    if report.reclaimed:
+        log.info(
+            "Reclaimed %d/%d locked item(s) via %s in %.1f ms",
+            report.reclaimed,
+            report.checked,
+            report.source,
+            report.duration * 1000,
+        )
+
 
-        await asyncio.sleep(CLEANUP_INTERVAL)
+async def release_idle_buffers(session_factory: async_sessionmaker) -> None:
+    """Hand the prefetched items of idle labelers back to the pending pool."""
+    for user_id in await idle_buffer_users(settings.prefetch_idle_seconds):
+        async with session_factory() as session:
+            released = await release_buffer(session, user_id)
+        if released:
+            log.info("Released %d buffered item(s) of idle user_id=%d", released, user_id)
@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from bot.config import settings
+from bot.services.metrics import timed_redis
+from bot.services.redis import redis
+
+# user:cursor:<id>:<kind> -> "label_count,created_at,item_id", the dispatch order key
+# of the last item claimed by the user in the current pass over item_queue. A pass
+# starts at the head of the queue and ends dispatch_rescan_seconds later however
+# often the cursor moves, so items that moved ahead of it are picked up in time.
+# "-" marks a pass that found nothing.
+CURSOR_PREFIX = "user:cursor:"
+# A pass from the head that found nothing is remembered this long, so a walk
+# over every pending row is not repeated on each click
+EXHAUSTED_SECONDS = 15
+
+
+@dataclass(frozen=True)
+class DispatchCursor:
+    label_count: int
+    created_at: datetime
+    item_id: int
+
+
+# Nothing to dispatch to the user until the "-" expires
+EXHAUSTED = DispatchCursor(-1, datetime.min.replace(tzinfo=UTC), 0)
+
+
+@timed_redis("get_cursor")
+async def get_cursor(user_id: int, kind: str) -> DispatchCursor | None:
+    raw = await redis.get(f"{CURSOR_PREFIX}{user_id}:{kind}")
+    if not raw:
+        return None
+    if raw == "-":
+        return EXHAUSTED
+    label_count, created_at, item_id = raw.split(",")
+    return DispatchCursor(int(label_count), datetime.fromisoformat(created_at), int(item_id))
+
+
+@timed_redis("set_cursor")
+async def set_cursor(user_id: int, kind: str, cursor: DispatchCursor, new_pass: bool) -> None:
+    """Move the user's cursor; ``new_pass`` after a walk from the head restarts its expiry."""
+    key = f"{CURSOR_PREFIX}{user_id}:{kind}"
+    value = f"{cursor.label_count},{cursor.created_at.isoformat()},{cursor.item_id}"
+    if new_pass:
+        await redis.set(key, value, ex=settings.dispatch_rescan_seconds)
+    else:
+        # xx: a pass that just ended must not come back without an expiry
+        await redis.set(key, value, xx=True, keepttl=True)
+
+
+@timed_redis("set_exhausted")
+async def set_exhausted(user_id: int, kind: str) -> None:
+    await redis.set(f"{CURSOR_PREFIX}{user_id}:{kind}", "-", ex=EXHAUSTED_SECONDS)
@@ -1,106 +1,420 @@
+import asyncio
+import csv
 import hashlib
-import io
 import logging
 import tempfile
+import time
+from collections import Counter, defaultdict
+from collections.abc import AsyncIterator, Callable, Generator, Iterator, Sequence
+from contextlib import aclosing, contextmanager, suppress
+from contextvars import ContextVar
 from dataclasses import dataclass
+from functools import partial
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import polars as pl
 import py7zr
-from sqlalchemy import select
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Column, MetaData, String, Table, Text, distinct, func, literal, select
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.db.models import Item, Label
+from bot.config import settings
+from bot.db.models import ExportWatermark, Item, ItemQueue, Label
+from bot.services.dedupe import hash_keys, text_hash_index
+from bot.services.metrics import observe_job
+from bot.services.stats import move_items
+from bot.services.workers import heavy_job, run_in_process, run_in_thread
 
 log = logging.getLogger(__name__)
 
 
+# Rows per CSV batch held in memory at once
+IMPORT_BATCH_SIZE = 100_000
+
+# Readers by file suffix. Columnar formats are scanned lazily, so only the
+# text column is ever read from disk
+_SCANNERS: dict[str, Callable[[Path], pl.LazyFrame]] = {
+    ".csv": partial(pl.scan_csv, encoding="utf8"),
+    ".parquet": pl.scan_parquet,
+    ".arrow": pl.scan_ipc,
+    ".ipc": pl.scan_ipc,
+    ".feather": pl.scan_ipc,
+    ".ndjson": pl.scan_ndjson,
+    ".jsonl": pl.scan_ndjson,
+}
+IMPORT_SUFFIXES = (".7z", *_SCANNERS)
+
+# Rows fetched per round trip from the server-side cursor during export
+EXPORT_BATCH_SIZE = 10_000
+
+# Export lags this far behind now(), so labels of still-open transactions
+# are not passed over by a watermark that has already moved on
+WATERMARK_LAG = timedelta(seconds=60)
+
+EXPORT_FORMATS = ("csv", "parquet")
+_EXPORT_SCHEMA = pa.schema([("text", pa.string()), ("score", pa.int16())])
+
+# Per-transaction staging area that COPY streams into
+_staging = Table(
+    "import_staging",
+    MetaData(),
+    Column("text", Text, nullable=False),
+    Column("text_hash", String(32), nullable=False),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+# Seconds per stage of the running import/export, while someone collects them
+_stage_times: ContextVar[dict[str, float] | None] = ContextVar("data_stage_times", default=None)
+
+
 @dataclass
 class ImportResult:
     loaded: int
-    duplicates: int
+    in_file_duplicates: int  # repeated rows within the uploaded file
+    db_duplicates: int  # texts that were already stored
     errors: int
 
 
-async def import_from_7z(session: AsyncSession, file_bytes: bytes) -> ImportResult:
-    buf = io.BytesIO(file_bytes)
-    csv_data: bytes | None = None
+@dataclass
+class ExportResult:
+    path: Path
+    rows: int
+    until: datetime  # labels created up to this moment are included
+
+
+@contextmanager
+def collect_stages() -> Iterator[dict[str, float]]:
+    """Sum up the time imports/exports run inside the block spend in each stage."""
+    times: dict[str, float] = defaultdict(float)
+    token = _stage_times.set(times)
+    try:
+        yield times
+    finally:
+        _stage_times.reset(token)
+
+
+@contextmanager
+def _stage(name: str) -> Iterator[None]:
+    times = _stage_times.get()
+    if times is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        times[name] += time.perf_counter() - started
+
+
+async def import_dataset(session: AsyncSession, path: Path) -> ImportResult:
+    """Import texts from a ``.7z`` archive (every data member in it) or a single data file."""
+    async with heavy_job():
+        return await _import(session, path)
+
+
+async def import_from_7z(session: AsyncSession, archive_path: Path) -> ImportResult:
+    return await import_dataset(session, archive_path)
+
+
+async def _import(session: AsyncSession, path: Path) -> ImportResult:
+    started = time.perf_counter()
+    with _stage("dedupe"):
+        await text_hash_index.ensure_loaded(session)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if path.suffix.lower() == ".7z":
+            with _stage("decompress"):
+                data_paths = await run_in_process(_extract_data_files, path, Path(tmpdir))
+        else:
+            data_paths = [path]
+
+        conn = await session.connection()
+        await conn.run_sync(_staging.create)
+        raw = await conn.get_raw_connection()
+        pg = raw.driver_connection  # asyncpg connection, for COPY
+
+        rows = 0
+        in_file_duplicates = 0
+        known_keys: list[pl.Series] = []
+        staged_keys: list[pl.Series] = []
+
+        # Closed before tmpdir goes, also on errors and cancellation
+        async with aclosing(_prefetch(_iter_text_batches(data_paths))) as batches:
+            async for batch in batches:
+                rows += batch.height
+                with _stage("dedupe"):
+                    texts = batch["text"].drop_nulls()
+                    unique_texts = texts.unique()
+                in_file_duplicates += len(texts) - len(unique_texts)
+                if unique_texts.is_empty():
+                    continue
+
+                with _stage("hash"):
+                    hashes = await _hash_bulk(unique_texts)
+                with _stage("dedupe"):
+                    keys = hash_keys(hashes)
+                    fresh = ~text_hash_index.contains(keys)
+                known_keys.append(keys.filter(~fresh))
+                if not fresh.any():
+                    continue
+
+                staged_keys.append(keys.filter(fresh))
+                with _stage("insert"):
+                    await pg.copy_records_to_table(
+                        _staging.name,
+                        records=zip(unique_texts.filter(fresh).to_list(), hashes.filter(fresh).to_list()),
+                        columns=["text", "text_hash"],
+                    )
+
+    if rows == 0:
+        raise ValueError("Файл не содержит строк.")
+
+    # Repeats that landed in different batches are only caught across all of them
+    known = pl.concat(known_keys) if known_keys else pl.Series("key", [], dtype=pl.Int64)
+    db_duplicates = known.n_unique()
+    in_file_duplicates += len(known) - db_duplicates
+
+    if not staged_keys:
+        observe_job("import", time.perf_counter() - started, rows)
+        return ImportResult(
+            loaded=0, in_file_duplicates=in_file_duplicates, db_duplicates=db_duplicates, errors=0
+        )
+
+    with _stage("dedupe"):
+        unique = (
+            await session.execute(select(func.count(distinct(_staging.c.text_hash))))
+        ).scalar() or 0
+    in_file_duplicates += sum(len(k) for k in staged_keys) - unique
+
+    inserted = (
+        pg_insert(Item)
+        .from_select(
+            ["text", "text_hash", "status"],
+            select(_staging.c.text, _staging.c.text_hash, literal("pending"))
+            .distinct(_staging.c.text_hash),
+        )
+        .on_conflict_do_nothing(index_elements=["text_hash"])
+        .returning(Item.id, Item.created_at, func.length(Item.text).label("text_len"))
+        .cte("inserted")
+    )
+    # New items enter the dispatch queue in the same statement
+    stmt = pg_insert(ItemQueue).from_select(
+        ["item_id", "status", "created_at", "text_len"],
+        select(inserted.c.id, literal("pending"), inserted.c.created_at, inserted.c.text_len),
+        include_defaults=False,  # label_count takes the server default
+    )
+    with _stage("insert"):
+        result = await session.execute(stmt)
+        loaded = result.rowcount  # type: ignore[union-attr]
+        await session.commit()
+    text_hash_index.add(pl.concat(staged_keys))
+    await move_items(Counter({("", "pending"): loaded}))
+
+    # Conflicts here are texts stored after the index was built (e.g. by another replica)
+    db_duplicates += unique - loaded
+    observe_job("import", time.perf_counter() - started, rows)
+
+    return ImportResult(
+        loaded=loaded, in_file_duplicates=in_file_duplicates, db_duplicates=db_duplicates, errors=0
+    )
+
+
+async def _hash_bulk(texts: pl.Series) -> pl.Series:
+    """md5 every text, fanned out across the worker processes."""
+    step = -(-len(texts) // settings.worker_processes)
+    parts = await asyncio.gather(
+        *(run_in_process(hash_texts, texts.slice(i, step)) for i in range(0, len(texts), step))
+    )
+    return pl.concat(parts)
 
+
+def hash_texts(texts: pl.Series) -> pl.Series:
+    return pl.Series("text_hash", [hashlib.md5(t.encode()).hexdigest() for t in texts], dtype=pl.String)
+
+
+def _extract_data_files(archive_path: Path, dest: Path) -> list[Path]:
+    """Unpack every member the importer can read into ``dest``; paths in name order."""
     try:
-        with py7zr.SevenZipFile(buf, mode="r") as archive:
-            for name, bio in archive.read().items():
-                if name.lower().endswith(".csv"):
-                    csv_data = bio.read()
-                    break
+        with py7zr.SevenZipFile(archive_path, mode="r") as archive:
+            names = sorted(
+                f.filename
+                for f in archive.list()
+                if not f.is_directory and Path(f.filename).suffix.lower() in _SCANNERS
+            )
+            if names:
+                archive.extract(path=dest, targets=names)
     except Exception as exc:
         raise ValueError(f"Не удалось открыть архив: {exc}") from exc
 
-    if csv_data is None:
-        raise ValueError("Архив не содержит CSV-файла.")
+    if not names:
+        raise ValueError("Архив не содержит файлов с данными (CSV, Parquet, Arrow, NDJSON).")
+
+    return [dest / name for name in names]
 
+
+def _scan_texts(paths: list[Path]) -> pl.LazyFrame:
+    """One lazy frame over the ``text`` column of all files, checked up front."""
+    frames = []
+    for path in paths:
+        scan = _SCANNERS.get(path.suffix.lower())
+        if scan is None:
+            raise ValueError(f"Неподдерживаемый формат файла: {path.name}")
+        try:
+            lf = scan(path)
+            columns = lf.collect_schema().names()
+        except Exception as exc:
+            raise ValueError(f"Не удалось прочитать {path.name}: {exc}") from exc
+        if "text" not in columns:
+            raise ValueError(f"{path.name} не содержит обязательный столбец 'text'.")
+        frames.append(lf.select(pl.col("text").cast(pl.String)))
+    return pl.concat(frames)
+
+
+def _iter_text_batches(paths: list[Path]) -> Generator[pl.DataFrame, None, None]:
+    batches = _scan_texts(paths).collect_batches(chunk_size=IMPORT_BATCH_SIZE)
+    while True:
+        try:
+            batch = next(batches)
+        except StopIteration:
+            return
+        except Exception as exc:
+            raise ValueError(f"Не удалось прочитать данные: {exc}") from exc
+        yield batch
+
+
+async def _prefetch(batches: Generator[pl.DataFrame, None, None]) -> AsyncIterator[pl.DataFrame]:
+    """Yield batches while the next one is already being read in a worker thread.
+
+    The "parse" stage then only counts the time the import actually waited for data.
+    Close it with ``aclose()``: that waits for the read in flight, which cannot be
+    cancelled, so the files are not removed under it.
+    """
+    pending = asyncio.ensure_future(run_in_thread(next, batches, None))
     try:
-        df = pl.read_csv(io.BytesIO(csv_data), encoding="utf8")
-    except Exception as exc:
-        raise ValueError(f"Не удалось прочитать CSV: {exc}") from exc
-
-    if df.is_empty():
-        raise ValueError("CSV-файл пуст.")
-
-    if "text" not in df.columns:
-        raise ValueError("CSV не содержит обязательный столбец 'text'.")
-
-    texts = df["text"].drop_nulls().unique().to_list()
-
-    if not texts:
-        return ImportResult(loaded=0, duplicates=0, errors=0)
-
-    # asyncpg limits query parameters to 32767; each row uses 3 params (text, text_hash, status)
-    batch_size = 5_000
-    loaded = 0
-
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i : i + batch_size]
-        rows = [
-            {
-                "text": t,
-                "text_hash": hashlib.md5(t.encode()).hexdigest(),
-                "status": "pending",
-            }
-            for t in batch
-        ]
-        stmt = pg_insert(Item).values(rows)
-        stmt = stmt.on_conflict_do_nothing(index_elements=["text_hash"])
-        result = await session.execute(stmt)
-        loaded += result.rowcount  # type: ignore[union-attr]
+        while True:
+            with _stage("parse"):
+                # Shielded so a cancelled import still waits for the read below
+                batch = await asyncio.shield(pending)
+            if batch is None:
+                return
+            pending = asyncio.ensure_future(run_in_thread(next, batches, None))
+            yield batch
+    finally:
+        with suppress(Exception):
+            await pending
+        batches.close()
 
-    await session.commit()
 
-    duplicates = len(texts) - loaded
+async def export_labels(
+    session: AsyncSession, dest_dir: Path, fmt: str = "csv", since: datetime | None = None
+) -> ExportResult | None:
+    """Write rated labels to ``dest_dir/dataset_export.7z`` (CSV) or ``.parquet``.
 
-    return ImportResult(loaded=loaded, duplicates=duplicates, errors=0)
+    With ``since``, only labels created after it are written. ``None`` if
+    there is nothing to export.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+    async with heavy_job():
+        return await _export(session, dest_dir, fmt, since)
 
 
-async def export_to_7z(session: AsyncSession) -> bytes | None:
-    rows = (
-        await session.execute(
-            select(Item.text, Label.score)
-            .join(Label, Label.item_id == Item.id)
-            .where(Label.action == "rated")
-        )
-    ).all()
+async def export_to_7z(session: AsyncSession, dest_dir: Path) -> Path | None:
+    """Full CSV export to ``dest_dir/dataset_export.7z``; ``None`` if there is nothing to export."""
+    result = await export_labels(session, dest_dir)
+    return result.path if result else None
+
+
+async def _export(
+    session: AsyncSession, dest_dir: Path, fmt: str, since: datetime | None
+) -> ExportResult | None:
+    started = time.perf_counter()
+    # Parquet is compressed as it is written; CSV goes into a .7z afterwards
+    data_path = dest_dir / ("dataset_export.parquet" if fmt == "parquet" else "dataset_export.csv")
+
+    # The newest labels may still be uncommitted behind older transactions;
+    # they are left for the next delta rather than skipped for good
+    until = (await session.execute(select(func.now() - WATERMARK_LAG))).scalar_one()
+
+    stmt = (
+        select(Item.text, Label.score)
+        .join(Label, Label.item_id == Item.id)
+        .where(Label.action == "rated", Label.created_at <= until)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if since is not None:
+        stmt = stmt.where(Label.created_at > since)
 
-    if not rows:
+    rows = 0
+    with _open_writer(fmt, data_path) as write:
+        with _stage("query"):
+            result = await session.stream(stmt)
+        partitions = result.partitions()
+        while True:
+            with _stage("query"):
+                partition = await anext(partitions, None)
+            if partition is None:
+                break
+            with _stage("write"):
+                await run_in_thread(write, partition)
+            rows += len(partition)
+
+    if rows == 0:
+        data_path.unlink()
         return None
 
-    df = pl.DataFrame({"text": [r[0] for r in rows], "score": [r[1] for r in rows]})
-    csv_bytes = df.write_csv().encode("utf-8")
+    out_path = data_path
+    if fmt == "csv":
+        out_path = dest_dir / "dataset_export.7z"
+        with _stage("compress"):
+            await run_in_process(_compress, data_path, out_path)
+        data_path.unlink()
+    observe_job("export", time.perf_counter() - started, rows)
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        csv_path = Path(tmpdir) / "dataset_export.csv"
-        csv_path.write_bytes(csv_bytes)
+    return ExportResult(path=out_path, rows=rows, until=until)
+
+
+@contextmanager
+def _open_writer(fmt: str, path: Path) -> Iterator[Callable[[Sequence[tuple[str, int]]], None]]:
+    """Open ``path`` and yield a function appending one partition of (text, score) rows."""
+    if fmt == "parquet":
+        # One zstd row group per partition
+        with pq.ParquetWriter(path, _EXPORT_SCHEMA, compression="zstd") as writer:
+            yield lambda rows: writer.write_table(pa.table(list(zip(*rows)), schema=_EXPORT_SCHEMA))
+        return
+    with path.open("w", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh, lineterminator="\n")
+        writer.writerow(["text", "score"])
+        yield writer.writerows
 
-        archive_buf = io.BytesIO()
-        with py7zr.SevenZipFile(archive_buf, mode="w") as archive:
-            archive.write(csv_path, arcname="dataset_export.csv")
-        return archive_buf.getvalue()
+
+def _compress(csv_path: Path, archive_path: Path) -> None:
+    with py7zr.SevenZipFile(archive_path, mode="w") as archive:
+        archive.write(csv_path, arcname=csv_path.name)
+
+
+# ── Export watermarks ────────────────────────────────────────────────
+
+
+async def get_watermark(session: AsyncSession, name: str) -> datetime | None:
+    return await session.scalar(
+        select(ExportWatermark.exported_until).where(ExportWatermark.name == name)
+    )
+
+
+async def set_watermark(session: AsyncSession, name: str, until: datetime) -> None:
+    """Move the watermark ``name`` to ``until``; it never moves backwards."""
+    stmt = pg_insert(ExportWatermark).values(name=name, exported_until=until)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ExportWatermark.name],
+        set_={
+            "exported_until": func.greatest(ExportWatermark.exported_until, stmt.excluded.exported_until),
+            "updated_at": func.now(),
+        },
+    )
+    await session.execute(stmt)
+    await session.commit()
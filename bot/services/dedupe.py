@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+import polars as pl
+from sqlalchemy import literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.db.models import Item
+
+log = logging.getLogger(__name__)
+
+# Leading hex digits of text_hash kept per item: 60 bits fit a signed int64
+KEY_HEX_DIGITS = 15
+LOAD_BATCH_SIZE = 100_000
+
+
+def hash_keys(hashes: pl.Series) -> pl.Series:
+    """Map md5 hex digests to the 60-bit integer keys stored in the index."""
+    return hashes.str.slice(0, KEY_HEX_DIGITS).str.to_integer(base=16).alias("key")
+
+
+# Same mapping as hash_keys(), computed by Postgres
+_DB_KEY = literal_column(
+    f"('x' || substr(text_hash, 1, {KEY_HEX_DIGITS}))::bit({4 * KEY_HEX_DIGITS})::bigint"
+)
+
+
+class TextHashIndex:
+    """Sorted int64 array of known ``text_hash`` prefixes, about 8 bytes per item.
+
+    Used to drop texts that are already stored before they are sent to
+    Postgres. A 60-bit prefix collision would make a new text look known;
+    with 10M stored items that is about 1e-11 per imported row.
+    """
+
+    def __init__(self) -> None:
+        self._keys: pl.Series | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._keys is not None
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        if self._keys is not None:
+            return
+        async with self._lock:
+            if self._keys is None:
+                await self.rebuild(session)
+
+    async def rebuild(self, session: AsyncSession) -> None:
+        chunks = [pl.Series("key", [], dtype=pl.Int64)]
+        result = await session.stream(
+            select(_DB_KEY).select_from(Item).execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        async for partition in result.partitions():
+            chunks.append(pl.Series("key", [row[0] for row in partition], dtype=pl.Int64))
+        self._keys = pl.concat(chunks).sort()
+        log.info("Text hash index rebuilt: %d key(s)", len(self._keys))
+
+    def contains(self, keys: pl.Series) -> pl.Series:
+        if self._keys is None:
+            return pl.Series("known", [False] * len(keys), dtype=pl.Boolean)
+        return keys.is_in(self._keys).alias("known")
+
+    def add(self, keys: pl.Series) -> None:
+        if self._keys is None:
+            return  # built from the DB on first use, which will include these
+        self._keys = pl.concat([self._keys, keys.cast(pl.Int64)]).unique().sort()
+
+
+text_hash_index = TextHashIndex()
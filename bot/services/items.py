@@ -1,50 +1,308 @@
+import asyncio
 import logging
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
 
-from sqlalchemy import select, update
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Select, any_, case, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from bot.db.models import Item, Label
-from bot.services.lock import acquire_item_lock, clear_user_current, release_item_lock
+from bot.config import settings
+from bot.db.models import Item, ItemQueue, Label
+from bot.services.buffer import drain_buffer, get_buffer, pop_buffer, push_buffer
+from bot.services.cursor import EXHAUSTED, DispatchCursor, get_cursor, set_cursor, set_exhausted
+from bot.services.lock import (
+    acquire_item_locks,
+    claim_item,
+    get_lock_owners,
+    release_item,
+    release_item_locks,
+    renew_item_locks,
+)
+from bot.services.rollups import add_to_rollups
+from bot.services.stats import move_items
+from bot.services.writebehind import BatchWriter
 
 log = logging.getLogger(__name__)
 
+# Background refills in flight, one per user
+_refills: dict[int, asyncio.Task] = {}
 
-async def get_next_task(session: AsyncSession, user_id: int) -> Item | None:
-    # Find a pending item not yet labeled/skipped by this user
-    subq = select(Label.item_id).where(Label.user_id == user_id).scalar_subquery()
-
-    stmt = (
-        select(Item)
-        .where(Item.status == "pending", Item.id.notin_(subq))
-        .order_by(Item.created_at.desc())
-        .limit(1)
+# Set by start_write_behind() when completions are batched
+_label_writer: "BatchWriter[Completion, bool] | None" = None
+
+
+def dispatch_query(
+    user_id: int, limit: int, max_chars: int | None = None, after: DispatchCursor | None = None
+) -> Select[tuple[int, int, datetime]]:
+    # Pending items not yet labeled/skipped by this user, those closest to
+    # label_overlap first, then newest. Walks ix_item_queue_dispatch and probes
+    # the labels PK per candidate. Pending items the user already labeled are
+    # stepped over one by one, and with fewer than label_overlap active
+    # labelers they pile up at the head of the order; ``after`` resumes the
+    # walk past the user's last claimed item so they are not walked each time.
+    seen = (
+        select(Label.item_id)
+        .where(Label.item_id == ItemQueue.item_id, Label.user_id == user_id)
+        .exists()
+    )
+
+    stmt = select(ItemQueue.item_id, ItemQueue.label_count, ItemQueue.created_at).where(
+        ItemQueue.status == "pending", ~seen
+    )
+    if max_chars is not None:
+        stmt = stmt.where(ItemQueue.text_len <= max_chars)
+    if after is not None:
+        # Every column of the order is descending, so "further on" is "smaller"
+        stmt = stmt.where(
+            tuple_(ItemQueue.label_count, ItemQueue.created_at, ItemQueue.item_id)
+            < tuple_(after.label_count, after.created_at, after.item_id)
+        )
+    return (
+        stmt.order_by(ItemQueue.label_count.desc(), ItemQueue.created_at.desc(), ItemQueue.item_id.desc())
+        .limit(limit)
         .with_for_update(skip_locked=True)
     )
 
-    item = (await session.execute(stmt)).scalar_one_or_none()
-    if item is None:
-        return None
 
-    acquired = await acquire_item_lock(item.id, user_id)
-    if not acquired:
-        return None
+async def claim_items(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    as_current: bool = False,
+    max_chars: int | None = None,
+) -> list[Item]:
+    kind = "all" if max_chars is None else "short"
+    cursor = await get_cursor(user_id, kind)
+    if cursor == EXHAUSTED:
+        return []
+    rows = (await session.execute(dispatch_query(user_id, limit, max_chars, cursor))).all()
+    if not rows and cursor is not None:
+        # Nothing left past the cursor: start a new pass from the head
+        cursor = None
+        rows = (await session.execute(dispatch_query(user_id, limit, max_chars))).all()
+    if not rows:
+        if max_chars is not None:
+            # The text_len filter is not in the index, so finding no short item
+            # took a walk over every pending row; the caller falls back to one item
+            await set_exhausted(user_id, kind)
+        return []
+    item_ids = [item_id for item_id, _, _ in rows]
+    last_id, last_count, last_created = rows[-1]
+    await set_cursor(user_id, kind, DispatchCursor(last_count, last_created, last_id), new_pass=cursor is None)
+
+    if as_current:
+        # A single task handed out right away: lock + current-task record in one script
+        acquired = [await claim_item(item_ids[0], user_id)]
+    else:
+        acquired = await acquire_item_locks(item_ids, user_id)
+    claimed = [item_id for item_id, ok in zip(item_ids, acquired) if ok]
+    if not claimed:
+        return []
 
-    item.status = "locked"
+    await session.execute(
+        update(ItemQueue).where(ItemQueue.item_id == any_(claimed)).values(status="locked")
+    )
+    # Texts come from the catalog only for the items actually handed out
+    found = {item.id: item for item in await session.scalars(select(Item).where(Item.id == any_(claimed)))}
     await session.commit()
+    await move_items(Counter({("pending", "locked"): len(claimed)}))
 
-    return item
+    return [found[item_id] for item_id in claimed]
 
 
-async def complete_task(
-    session: AsyncSession, item_id: int, user_id: int, score: int | None, action: str
-) -> None:
-    new_status = "labeled" if action == "rated" else "skipped"
+async def get_next_task(session: AsyncSession, user_id: int) -> Item | None:
+    if settings.prefetch_size > 0:
+        item = await _pop_buffered_task(session, user_id)
+        if item is not None:
+            return item
+
+    claimed = await claim_items(session, user_id, 1, as_current=True)
+    return claimed[0] if claimed else None
+
 
-    await session.execute(update(Item).where(Item.id == item_id).values(status=new_status))
+async def _pop_buffered_task(session: AsyncSession, user_id: int) -> Item | None:
+    # pop_buffer skips items whose lease lapsed and were reclaimed in the meantime
+    while (item_id := await pop_buffer(user_id)) is not None:
+        item = await session.scalar(
+            select(Item)
+            .join(ItemQueue, ItemQueue.item_id == Item.id)
+            .where(Item.id == item_id, ItemQueue.status == "locked")
+        )
+        if item is not None:
+            return item
+    return None
 
-    label = Label(item_id=item_id, user_id=user_id, score=score, action=action)
-    session.add(label)
+
+async def refill_buffer(session: AsyncSession, user_id: int) -> int:
+    """Top up the user's prefetch buffer and renew leases on what is already in it."""
+    buffered = await get_buffer(user_id)
+    await renew_item_locks(buffered)
+
+    missing = settings.prefetch_size - len(buffered)
+    if missing <= 0:
+        return 0
+
+    claimed = await claim_items(session, user_id, missing)
+    await push_buffer(user_id, [item.id for item in claimed])
+    return len(claimed)
+
+
+def schedule_refill(session_factory: async_sessionmaker, user_id: int) -> None:
+    if settings.prefetch_size <= 0:
+        return
+    task = _refills.get(user_id)
+    if task is not None and not task.done():
+        return
+    _refills[user_id] = asyncio.create_task(_run_refill(session_factory, user_id))
+
+
+async def _run_refill(session_factory: async_sessionmaker, user_id: int) -> None:
+    try:
+        async with session_factory() as session:
+            await refill_buffer(session, user_id)
+    except Exception:
+        log.exception("Error refilling buffer for user_id=%d", user_id)
+    finally:
+        _refills.pop(user_id, None)
+
+
+async def release_buffer(session: AsyncSession, user_id: int) -> int:
+    """Return every buffered item still leased to the user back to 'pending'."""
+    item_ids = await drain_buffer(user_id)
+    owners = await get_lock_owners(item_ids)
+    owned = [item_id for item_id, owner in zip(item_ids, owners) if owner == user_id]
+    if not owned:
+        return 0
+
+    result = await session.execute(
+        update(ItemQueue)
+        .where(ItemQueue.item_id.in_(owned), ItemQueue.status == "locked")
+        .values(status="pending")
+    )
     await session.commit()
+    await move_items(Counter({("locked", "pending"): result.rowcount}))  # type: ignore[union-attr]
+    await release_item_locks(owned)
+
+    return len(owned)
+
+
+@dataclass
+class Completion:
+    item_id: int
+    user_id: int
+    score: int | None
+    action: str  # "rated" or "skipped"
+    seconds: float | None = None  # time the user spent on the item, if known
+
+
+class AlreadyLabeled(Exception):
+    """The user has already labeled this item (e.g. a repeated button press)."""
+
+
+async def record_completions(session: AsyncSession, completions: list[Completion]) -> list[bool]:
+    """Store labels and item statuses for a batch of completions in one transaction.
+
+    Returns, per completion, whether its label was new.
+    """
+    inserted = set(
+        (
+            await session.execute(
+                pg_insert(Label)
+                .on_conflict_do_nothing(index_elements=["item_id", "user_id"])
+                .returning(Label.item_id, Label.user_id),
+                [
+                    {"item_id": c.item_id, "user_id": c.user_id, "score": c.score, "action": c.action}
+                    for c in completions
+                ],
+            )
+        ).tuples()
+    )
+    done = [c for c in completions if (c.item_id, c.user_id) in inserted]
+
+    moves: Counter[tuple[str, str]] = Counter()
+    if done:
+        # Counted from the labels just inserted, so two completions of one item
+        # in a batch both count. A skip only retires the item without overlap.
+        rated = (
+            select(func.count())
+            .where(Label.item_id == ItemQueue.item_id, Label.action == "rated")
+            .scalar_subquery()
+        )
+        unfinished = "skipped" if settings.label_overlap == 1 else "pending"
+        # Read the previous status in the same statement, usually 'locked' but
+        # 'pending' if the lease lapsed and the item was reclaimed meanwhile.
+        # An item already archived (a late answer to a lapsed lease) keeps its
+        # final state; only the label is added.
+        before = (
+            select(ItemQueue.item_id, ItemQueue.status)
+            .where(ItemQueue.item_id == any_([c.item_id for c in done]))
+            .subquery()
+        )
+        moves.update(
+            (
+                await session.execute(
+                    update(ItemQueue)
+                    .where(ItemQueue.item_id == before.c.item_id)
+                    .values(
+                        label_count=rated,
+                        status=case((rated >= settings.label_overlap, "labeled"), else_=unfinished),
+                    )
+                    .returning(before.c.status, ItemQueue.status)
+                )
+            ).tuples()
+        )
+        await add_to_rollups(session, [(c.user_id, c.action, c.seconds) for c in done])
+    await session.commit()
+    await move_items(moves, Counter(c.user_id for c in done if c.action == "rated"))
+
+    return [(c.item_id, c.user_id) in inserted for c in completions]
+
+
+async def _flush_completions(
+    session_factory: async_sessionmaker, completions: list[Completion]
+) -> list[bool]:
+    async with session_factory() as session:
+        return await record_completions(session, completions)
+
+
+def start_write_behind(session_factory: async_sessionmaker) -> None:
+    global _label_writer
+    _label_writer = BatchWriter(
+        partial(_flush_completions, session_factory),
+        interval=settings.write_behind_flush_ms / 1000,
+        batch_size=settings.write_behind_batch_size,
+    )
+    _label_writer.start()
+
+
+async def stop_write_behind() -> None:
+    global _label_writer
+    if _label_writer is not None:
+        await _label_writer.close()
+        _label_writer = None
+
+
+async def complete_task(
+    session: AsyncSession,
+    item_id: int,
+    user_id: int,
+    score: int | None,
+    action: str,
+    seconds: float | None = None,
+) -> None:
+    completion = Completion(
+        item_id=item_id, user_id=user_id, score=score, action=action, seconds=seconds
+    )
+
+    # The write is committed before the lock goes, whichever path stores it
+    if _label_writer is not None:
+        created = await _label_writer.submit(completion)
+    else:
+        [created] = await record_completions(session, [completion])
+    if not created:
+        raise AlreadyLabeled(item_id)
 
-    await release_item_lock(item_id)
-    await clear_user_current(user_id)
+    await release_item(item_id, user_id)
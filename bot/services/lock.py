@@ -1,42 +1,212 @@
+import asyncio
 import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
 from bot.config import settings
+from bot.services.metrics import timed_redis
 from bot.services.redis import redis
 
 log = logging.getLogger(__name__)
 
 LOCK_PREFIX = "lock:item:"
-CURRENT_ITEM_PREFIX = "user:current_item:"
-CURRENT_MSG_PREFIX = "user:current_msg:"
+STATE_PREFIX = "user:state:"  # hash: item -> current item id, msg -> its message id
+# Per-user update sequencer. user:turn:<id> is a zset of the user's updates waiting or
+# running, scored by update_id; user:turn:<id>:run holds the update_id whose turn it is,
+# :live:<update_id> is the lease of each queued update, :wake:<update_id> its wake-up list
+TURN_PREFIX = "user:turn:"
+TURN_POLL_SECONDS = 1.0  # re-check while waiting, in case the update ahead died without a wake-up
 
+# Lock the item and make it the user's current task, or do nothing if it is taken.
+# KEYS: lock, user state. ARGV: user_id, item_id, ttl
+_CLAIM = redis.register_script(
+    """
+    if not redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[3]) then
+        return 0
+    end
+    redis.call('HSET', KEYS[2], 'item', ARGV[2])
+    redis.call('HDEL', KEYS[2], 'msg')
+    return 1
+    """
+)
 
-async def acquire_item_lock(item_id: int, user_id: int) -> bool:
-    key = f"{LOCK_PREFIX}{item_id}"
-    acquired = await redis.set(key, str(user_id), nx=True, ex=settings.lock_ttl_seconds)
-    return acquired is not None
+# Drop the lock if the user still owns it and clear the user's current task if it is this item.
+# KEYS: lock, user state. ARGV: user_id, item_id
+_RELEASE = redis.register_script(
+    """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        redis.call('DEL', KEYS[1])
+    end
+    if redis.call('HGET', KEYS[2], 'item') == ARGV[2] then
+        redis.call('DEL', KEYS[2])
+    end
+    return 1
+    """
+)
 
+# Queue the update and take the turn if it is the oldest live one in the queue.
+# Entries whose lease lapsed (their replica died) are dropped from the head first.
+# KEYS: queue, run. ARGV: update_id, ttl_ms, key prefix, "1" to take the turn or "0" to only queue
+_TURN_ENTER = redis.register_script(
+    """
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[1])
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    redis.call('SET', ARGV[3] .. 'live:' .. ARGV[1], 1, 'PX', ARGV[2])
+    if ARGV[4] == '0' then
+        return 0
+    end
+    local head = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+    while head and redis.call('EXISTS', ARGV[3] .. 'live:' .. head) == 0 do
+        redis.call('ZREM', KEYS[1], head)
+        head = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+    end
+    if head == ARGV[1] and redis.call('SET', KEYS[2], ARGV[1], 'NX', 'PX', ARGV[2]) then
+        return 1
+    end
+    return 0
+    """
+)
 
-async def release_item_lock(item_id: int) -> None:
-    await redis.delete(f"{LOCK_PREFIX}{item_id}")
+# Extend the update's lease, and the turn if it holds it.
+# KEYS: queue, run. ARGV: update_id, ttl_ms, key prefix
+_TURN_RENEW = redis.register_script(
+    """
+    redis.call('PEXPIRE', ARGV[3] .. 'live:' .. ARGV[1], ARGV[2])
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    if redis.call('GET', KEYS[2]) == ARGV[1] then
+        redis.call('PEXPIRE', KEYS[2], ARGV[2])
+    end
+    return 1
+    """
+)
 
+# Leave the queue, give up the turn and wake the update that is next.
+# KEYS: queue, run. ARGV: update_id, ttl_ms, key prefix
+_TURN_LEAVE = redis.register_script(
+    """
+    if redis.call('GET', KEYS[2]) == ARGV[1] then
+        redis.call('DEL', KEYS[2])
+    end
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('DEL', ARGV[3] .. 'live:' .. ARGV[1], ARGV[3] .. 'wake:' .. ARGV[1])
+    local head = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+    if head then
+        redis.call('RPUSH', ARGV[3] .. 'wake:' .. head, 1)
+        redis.call('PEXPIRE', ARGV[3] .. 'wake:' .. head, ARGV[2])
+    end
+    return 1
+    """
+)
 
+
+@timed_redis("claim")
+async def claim_item(item_id: int, user_id: int) -> bool:
+    """Lock the item for the user and record it as their current task, atomically."""
+    claimed = await _CLAIM(
+        keys=[f"{LOCK_PREFIX}{item_id}", f"{STATE_PREFIX}{user_id}"],
+        args=[user_id, item_id, settings.lock_ttl_seconds],
+    )
+    return bool(claimed)
+
+
+@timed_redis("release")
+async def release_item(item_id: int, user_id: int) -> None:
+    """Release the user's lock on the item and clear it as their current task, atomically."""
+    await _RELEASE(
+        keys=[f"{LOCK_PREFIX}{item_id}", f"{STATE_PREFIX}{user_id}"],
+        args=[user_id, item_id],
+    )
+
+
+@timed_redis("acquire_locks")
+async def acquire_item_locks(item_ids: list[int], user_id: int) -> list[bool]:
+    async with redis.pipeline(transaction=False) as pipe:
+        for item_id in item_ids:
+            pipe.set(f"{LOCK_PREFIX}{item_id}", str(user_id), nx=True, ex=settings.lock_ttl_seconds)
+        results = await pipe.execute()
+    return [r is not None for r in results]
+
+
+@timed_redis("renew_locks")
+async def renew_item_locks(item_ids: list[int]) -> None:
+    if not item_ids:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        for item_id in item_ids:
+            pipe.expire(f"{LOCK_PREFIX}{item_id}", settings.lock_ttl_seconds)
+        await pipe.execute()
+
+
+@timed_redis("release_locks")
+async def release_item_locks(item_ids: list[int]) -> None:
+    if item_ids:
+        await redis.delete(*(f"{LOCK_PREFIX}{item_id}" for item_id in item_ids))
+
+
+@timed_redis("get_owner")
 async def get_lock_owner(item_id: int) -> int | None:
     val = await redis.get(f"{LOCK_PREFIX}{item_id}")
     return int(val) if val else None
 
 
+@timed_redis("get_owners")
+async def get_lock_owners(item_ids: list[int]) -> list[int | None]:
+    if not item_ids:
+        return []
+    values = await redis.mget([f"{LOCK_PREFIX}{item_id}" for item_id in item_ids])
+    return [int(v) if v else None for v in values]
+
+
+@timed_redis("set_current")
 async def set_user_current(user_id: int, item_id: int, message_id: int) -> None:
-    await redis.set(f"{CURRENT_ITEM_PREFIX}{user_id}", str(item_id))
-    await redis.set(f"{CURRENT_MSG_PREFIX}{user_id}", str(message_id))
+    await redis.hset(f"{STATE_PREFIX}{user_id}", mapping={"item": item_id, "msg": message_id})
 
 
+@timed_redis("get_current")
 async def get_user_current(user_id: int) -> tuple[int | None, int | None]:
-    item_raw = await redis.get(f"{CURRENT_ITEM_PREFIX}{user_id}")
-    msg_raw = await redis.get(f"{CURRENT_MSG_PREFIX}{user_id}")
+    item_raw, msg_raw = await redis.hmget(f"{STATE_PREFIX}{user_id}", ["item", "msg"])
     item_id = int(item_raw) if item_raw else None
     msg_id = int(msg_raw) if msg_raw else None
     return item_id, msg_id
 
 
+@timed_redis("clear_current")
 async def clear_user_current(user_id: int) -> None:
-    await redis.delete(f"{CURRENT_ITEM_PREFIX}{user_id}", f"{CURRENT_MSG_PREFIX}{user_id}")
+    await redis.delete(f"{STATE_PREFIX}{user_id}")
+
+
+@asynccontextmanager
+async def user_turn(user_id: int, update_id: int) -> AsyncIterator[None]:
+    """Hold the user's turn across all replicas while the block runs.
+
+    Updates of one user queued at the same time get the turn in update_id
+    order. An update first waits ``sequencer_reorder_ms`` for earlier ones
+    still on their way from Telegram, which may deliver them over other
+    connections. The turn is leased for ``sequencer_lock_ms`` and renewed
+    while the block runs, so only a crashed replica lets it lapse.
+    """
+    keys = [f"{TURN_PREFIX}{user_id}", f"{TURN_PREFIX}{user_id}:run"]
+    args = [update_id, settings.sequencer_lock_ms, f"{TURN_PREFIX}{user_id}:"]
+    wake_key = f"{TURN_PREFIX}{user_id}:wake:{update_id}"
+
+    renewer = asyncio.create_task(_renew_turn(keys, args))
+    try:
+        if settings.sequencer_reorder_ms > 0:
+            await _TURN_ENTER(keys=keys, args=[*args, "0"])
+            await asyncio.sleep(settings.sequencer_reorder_ms / 1000)
+        while not await _TURN_ENTER(keys=keys, args=[*args, "1"]):
+            await redis.blpop([wake_key], timeout=TURN_POLL_SECONDS)
+        yield
+    finally:
+        renewer.cancel()
+        await _TURN_LEAVE(keys=keys, args=args)
+
+
+async def _renew_turn(keys: list[str], args: list) -> None:
+    interval = settings.sequencer_lock_ms / 3000
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await _TURN_RENEW(keys=keys, args=args)
+        except Exception:
+            log.exception("Failed to renew the turn of update %s", args[0])
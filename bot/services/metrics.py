@@ -0,0 +1,137 @@
+# Prometheus metrics, enabled when BOT_METRICS_PORT is set. prometheus-client is an
+# optional dependency (the "metrics" extra). While metrics are off nothing is
+# instrumented: decorators return the function as is and no hooks are installed.
+
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from functools import wraps
+from typing import ParamSpec, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from bot.config import settings
+from bot.services.stats import read_stats
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server
+except ImportError:  # optional dependency
+    start_http_server = None  # type: ignore[assignment]
+
+log = logging.getLogger(__name__)
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+enabled = settings.metrics_port is not None and start_http_server is not None
+
+# Fast operations (SQL, Redis, pool checkout) need sub-millisecond buckets
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+if start_http_server is not None:
+    UPDATE_SECONDS = Histogram(
+        "bot_update_seconds", "Time to process an update, including auth", ["type"]
+    )
+    HANDLER_SECONDS = Histogram(
+        "bot_handler_seconds", "Time spent in a handler", ["router", "handler"]
+    )
+    BOT_API_SECONDS = Histogram("bot_api_seconds", "Bot API call latency", ["method"])
+    BOT_API_ERRORS = Counter("bot_api_errors_total", "Failed Bot API calls", ["method", "error"])
+    SQL_SECONDS = Histogram("bot_sql_seconds", "SQL statement latency", ["statement"], buckets=_FAST_BUCKETS)
+    SQL_ERRORS = Counter("bot_sql_errors_total", "Failed SQL statements", ["statement"])
+    REDIS_SECONDS = Histogram("bot_redis_seconds", "Redis operation latency", ["op"], buckets=_FAST_BUCKETS)
+    POOL_WAIT_SECONDS = Histogram(
+        "bot_db_pool_wait_seconds", "Time to check a connection out of the pool", buckets=_FAST_BUCKETS
+    )
+    POOL_IN_USE = Gauge("bot_db_pool_in_use", "Connections checked out of the pool")
+    POOL_CAPACITY = Gauge("bot_db_pool_capacity", "Pool size plus max overflow")
+    ITEMS = Gauge("bot_items", "Items by status", ["status"])
+    JOB_SECONDS = Histogram(
+        "bot_job_seconds", "Import/export duration", ["job"], buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800)
+    )
+    JOB_ROWS_PER_SECOND = Gauge("bot_job_rows_per_second", "Throughput of the last import/export", ["job"])
+
+
+def start_metrics_server() -> None:
+    if settings.metrics_port is None:
+        return
+    if start_http_server is None:
+        log.warning("BOT_METRICS_PORT is set but prometheus-client is not installed, metrics are off")
+        return
+    start_http_server(settings.metrics_port)
+    log.info("Metrics on :%d/metrics", settings.metrics_port)
+
+
+def timed_redis(op: str) -> Callable[[Callable[P, Awaitable[R]]], Callable[P, Awaitable[R]]]:
+    """Record the latency of an async Redis helper as ``bot_redis_seconds{op=...}``."""
+
+    def decorate(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+        if not enabled:
+            return func
+        histogram = REDIS_SECONDS.labels(op)
+
+        @wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorate
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    if not enabled:
+        return
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        SQL_SECONDS.labels(_statement_kind(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _error(context):
+        # A failed statement never reaches after_cursor_execute; pop its start
+        # here so the stack does not grow on a connection that lives on.
+        conn = context.connection
+        if conn is None or context.statement is None or not conn.info.get("query_started"):
+            return
+        started = conn.info["query_started"].pop()
+        kind = _statement_kind(context.statement)
+        SQL_SECONDS.labels(kind).observe(time.perf_counter() - started)
+        SQL_ERRORS.labels(kind).inc()
+
+
+def _statement_kind(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+
+
+def observe_pool_wait(seconds: float) -> None:
+    if enabled:
+        POOL_WAIT_SECONDS.observe(seconds)
+
+
+def observe_job(job: str, seconds: float, rows: int) -> None:
+    if enabled:
+        JOB_SECONDS.labels(job).observe(seconds)
+        JOB_ROWS_PER_SECOND.labels(job).set(rows / seconds if seconds else 0)
+
+
+async def refresh_gauges(engine: AsyncEngine) -> None:
+    """Update the gauges that are sampled rather than observed."""
+    snap = engine.pool.snapshot()  # type: ignore[attr-defined]
+    POOL_IN_USE.set(snap.checked_out)
+    POOL_CAPACITY.set(snap.capacity)
+
+    stats = await read_stats()
+    if stats is not None:
+        for status, count in stats.by_status.items():
+            ITEMS.labels(status).set(count)
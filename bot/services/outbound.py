@@ -0,0 +1,283 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, EditMessageReplyMarkup, EditMessageText, Response, TelegramMethod
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE = 0  # replies to a labeler's action
+BULK = 1  # large uploads and other work nobody is waiting on interactively
+
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def outbound_priority(priority: int) -> Iterator[None]:
+    """Send the Bot API calls made inside the block with ``priority``."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket whose waiters are served by priority, then in arrival order.
+
+    With ``deferred`` a grant only reserves the token: nobody else is served
+    until the holder calls ``spend()`` (when the call actually goes out) or
+    ``release()``. That keeps the spacing Telegram sees even when the call
+    then waits on another bucket.
+    """
+
+    def __init__(self, rate: float, capacity: float, deferred: bool = False) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.deferred = deferred
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._held = False
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return not self._waiters and not self._held and self._tokens >= self.capacity
+
+    async def acquire(self, priority: int, ticket: asyncio.Future) -> bool:
+        """Wait for a token.
+
+        Returns ``False`` without taking a token if ``ticket`` is resolved by
+        someone else first (the request became redundant while it waited).
+        """
+        self._refill()
+        if not self._waiters and self._available():
+            self._take()
+            return True
+        heapq.heappush(self._waiters, (priority, next(self._seq), ticket))
+        self._schedule()
+        return await ticket
+
+    def spend(self) -> None:
+        self._refill()
+        self._held = False
+        self._tokens -= 1
+        self._schedule()
+
+    def release(self) -> None:
+        self._held = False
+        self._schedule()
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for ``seconds`` (Telegram asked us to back off)."""
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def _available(self) -> bool:
+        return self._tokens >= 1 and not self._held
+
+    def _take(self) -> None:
+        if self.deferred:
+            self._held = True
+        else:
+            self._tokens -= 1
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _schedule(self) -> None:
+        if self._timer is None and self._waiters and not self._held:
+            delay = max(0.0, (1 - self._tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._grant)
+
+    def _grant(self) -> None:
+        self._timer = None
+        self._refill()
+        while self._waiters and self._available():
+            _, _, ticket = heapq.heappop(self._waiters)
+            if ticket.done():
+                continue  # replaced or cancelled while waiting
+            self._take()
+            ticket.set_result(True)
+        # Drop abandoned tickets at the head so they do not keep the timer alive
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        self._schedule()
+
+
+@dataclass
+class _Queued:
+    method: TelegramMethod
+    result: asyncio.Future  # Response of this request or of the one that replaced it
+    ticket: asyncio.Future | None = None
+    sent: bool = False
+    replaced_by: "_Queued | None" = field(default=None, repr=False)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Shapes every Bot API call that posts into a chat.
+
+    * a global and a per-chat token bucket keep us under Telegram's limits,
+      interactive replies are served before bulk ones;
+    * ``retry_after`` from a 429 pauses the affected bucket and the call is retried;
+    * an edit still waiting for a token is dropped when a newer edit or a
+      delete of the same message arrives; its caller gets the newer result.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_retries: int,
+        max_chats: int = 10_000,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict[Any, TokenBucket] = {}
+        self._queued: dict[tuple[Any, int], _Queued] = {}
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # Not a chat message call (answerCallbackQuery, getUpdates, …)
+            return await self._send(make_request, bot, method, self._global)
+
+        loop = asyncio.get_running_loop()
+        entry = _Queued(method, loop.create_future())
+        entry.result.add_done_callback(_consume_exception)
+        key = _message_key(method)
+        if key is not None:
+            previous = self._queued.get(key)
+            self._queued[key] = entry
+            if previous is not None and not previous.sent and _replaces(method, previous.method):
+                previous.replaced_by = entry
+                if previous.ticket is not None and not previous.ticket.done():
+                    previous.ticket.set_result(False)
+
+        try:
+            response = await self._schedule(make_request, bot, method, entry, chat_id)
+        except asyncio.CancelledError:
+            entry.result.cancel()
+            raise
+        except Exception as e:
+            if not entry.result.done():
+                entry.result.set_exception(e)
+            raise
+        finally:
+            if key is not None and self._queued.get(key) is entry:
+                del self._queued[key]
+
+        if not entry.result.done():
+            entry.result.set_result(response)
+        return response
+
+    async def _schedule(
+        self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod, entry: _Queued, chat_id: Any
+    ) -> Response:
+        priority = _priority.get()
+        chat = self._chat_bucket(chat_id)
+        loop = asyncio.get_running_loop()
+
+        entry.ticket = loop.create_future()
+        try:
+            granted = await chat.acquire(priority, entry.ticket)
+        except asyncio.CancelledError:
+            # Cancelled after _grant reserved the token for us but before we resumed
+            ticket = entry.ticket
+            if ticket.done() and not ticket.cancelled() and ticket.result():
+                chat.release()
+            raise
+        if granted:
+            try:
+                entry.ticket = loop.create_future()
+                if await self._global.acquire(priority, entry.ticket):
+                    chat.spend()
+                    entry.sent = True
+            finally:
+                if not entry.sent:
+                    chat.release()
+
+        if not entry.sent:
+            log.debug("Coalesced %s in chat %s", type(method).__name__, chat_id)
+            return await asyncio.shield(entry.replaced_by.result)  # type: ignore[union-attr]
+
+        return await self._send(make_request, bot, method, chat)
+
+    async def _send(
+        self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod, bucket: TokenBucket
+    ) -> Response:
+        for attempt in itertools.count():
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                log.warning(
+                    "%s hit flood control, retrying in %ds (%d/%d)",
+                    type(method).__name__,
+                    e.retry_after,
+                    attempt + 1,
+                    self.max_retries,
+                )
+                bucket.pause(e.retry_after)
+                await asyncio.sleep(e.retry_after)
+        raise AssertionError("unreachable")
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, deferred=True)
+        return bucket
+
+
+def _message_key(method: TelegramMethod) -> tuple[Any, int] | None:
+    if isinstance(method, (EditMessageText, EditMessageReplyMarkup, DeleteMessage)) and method.message_id:
+        return method.chat_id, method.message_id
+    return None
+
+
+def _replaces(new: TelegramMethod, old: TelegramMethod) -> bool:
+    """Whether sending ``old`` first would make no visible difference once ``new`` is sent."""
+    if isinstance(new, DeleteMessage):
+        return isinstance(old, (EditMessageText, EditMessageReplyMarkup))
+    if isinstance(new, EditMessageText):
+        return isinstance(old, (EditMessageText, EditMessageReplyMarkup))
+    if isinstance(new, EditMessageReplyMarkup):
+        return isinstance(old, EditMessageReplyMarkup)
+    return False
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # Results are only awaited by replaced requests; don't warn when nobody did
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,140 @@
+import bisect
+from collections import Counter, defaultdict
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.db.models import LabelRollup
+
+# Upper bounds (seconds) of the duration bins; the last bin is open-ended
+DURATION_EDGES = (2, 4, 6, 8, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+UNKNOWN_BIN = -1  # no timing (e.g. labels backfilled from before the rollups existed)
+
+
+@dataclass
+class LabelerStats:
+    rated: int
+    skipped: int
+    last_hour: int  # items done in the current hour bucket
+    last_day: int  # items done in the last 24 hour buckets
+    median_seconds: float | None  # per item, over the last day
+
+
+@dataclass
+class LabelerSpeed:
+    user_id: int
+    items: int
+    per_hour: float  # items per hour in which the user labeled at all
+    median_seconds: float | None
+
+
+def duration_bin(seconds: float | None) -> int:
+    if seconds is None:
+        return UNKNOWN_BIN
+    return bisect.bisect_right(DURATION_EDGES, max(seconds, 0))
+
+
+def median_seconds(bins: Mapping[int, int]) -> float | None:
+    """Median item duration estimated from bin counts, interpolated within its bin."""
+    known = sorted((b, n) for b, n in bins.items() if b != UNKNOWN_BIN and n > 0)
+    half = sum(n for _, n in known) / 2
+    seen = 0
+    for b, n in known:
+        if seen + n >= half:
+            lo = DURATION_EDGES[b - 1] if b > 0 else 0
+            if b == len(DURATION_EDGES):
+                return float(lo)
+            return lo + (DURATION_EDGES[b] - lo) * (half - seen) / n
+        seen += n
+    return None
+
+
+async def add_to_rollups(
+    session: AsyncSession, labels: Iterable[tuple[int, str, float | None]]
+) -> None:
+    """Count ``(user_id, action, seconds)`` labels into the current hour, in the caller's transaction."""
+    counts = Counter((user_id, duration_bin(seconds), action) for user_id, action, seconds in labels)
+    if not counts:
+        return
+
+    rows: dict[tuple[int, int], dict[str, int]] = {}
+    for (user_id, bin_, action), n in counts.items():
+        row = rows.setdefault(
+            (user_id, bin_), {"user_id": user_id, "duration_bin": bin_, "rated": 0, "skipped": 0}
+        )
+        row["rated" if action == "rated" else "skipped"] += n
+
+    stmt = pg_insert(LabelRollup).values(hour=func.date_trunc("hour", func.now()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "hour", "duration_bin"],
+        set_={
+            "rated": LabelRollup.rated + stmt.excluded.rated,
+            "skipped": LabelRollup.skipped + stmt.excluded.skipped,
+        },
+    )
+    # Fixed row order so concurrent batches cannot deadlock on each other
+    await session.execute(stmt, [rows[key] for key in sorted(rows)])
+
+
+async def get_labeler_stats(session: AsyncSession, user_id: int) -> LabelerStats:
+    """All personal numbers in one query over the user's rollup rows."""
+    done = LabelRollup.rated + LabelRollup.skipped
+    hour = LabelRollup.hour >= func.date_trunc("hour", func.now())
+    day = LabelRollup.hour > func.now() - timedelta(days=1)
+
+    rows = await session.execute(
+        select(
+            LabelRollup.duration_bin,
+            func.sum(LabelRollup.rated),
+            func.sum(LabelRollup.skipped),
+            func.sum(done).filter(hour),
+            func.sum(done).filter(day),
+        )
+        .where(LabelRollup.user_id == user_id)
+        .group_by(LabelRollup.duration_bin)
+    )
+
+    stats = LabelerStats(rated=0, skipped=0, last_hour=0, last_day=0, median_seconds=None)
+    day_bins: dict[int, int] = {}
+    for bin_, rated, skipped, in_hour, in_day in rows.tuples():
+        stats.rated += rated
+        stats.skipped += skipped
+        stats.last_hour += in_hour or 0
+        stats.last_day += in_day or 0
+        day_bins[bin_] = in_day or 0
+    stats.median_seconds = median_seconds(day_bins)
+    return stats
+
+
+async def get_labeler_speeds(session: AsyncSession, period: timedelta) -> list[LabelerSpeed]:
+    """Per-labeler throughput over the last ``period``, fastest (by median) first."""
+    rows = await session.execute(
+        select(
+            LabelRollup.user_id,
+            LabelRollup.hour,
+            LabelRollup.duration_bin,
+            LabelRollup.rated + LabelRollup.skipped,
+        ).where(LabelRollup.hour > func.now() - period)
+    )
+
+    bins: dict[int, Counter[int]] = defaultdict(Counter)
+    hours: dict[int, set] = defaultdict(set)
+    for user_id, hour, bin_, n in rows.tuples():
+        bins[user_id][bin_] += n
+        hours[user_id].add(hour)
+
+    speeds = [
+        LabelerSpeed(
+            user_id=user_id,
+            items=sum(counts.values()),
+            per_hour=sum(counts.values()) / len(hours[user_id]),
+            median_seconds=median_seconds(counts),
+        )
+        for user_id, counts in bins.items()
+    ]
+    speeds.sort(key=lambda s: (s.median_seconds is None, s.median_seconds or 0))
+    return speeds
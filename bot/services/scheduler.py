@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from bot.config import settings
+from bot.services.redis import redis
+
+log = logging.getLogger(__name__)
+
+LEADER_KEY = "scheduler:leader"  # "<replica id>:<fencing token>" of the current leader
+EPOCH_KEY = "scheduler:epoch"  # bumped on every change of leader, source of fencing tokens
+RESTART_DELAY = 5  # seconds before a crashed job is started again
+
+# Take the lease if it is free, or renew it if we hold it. Returns the fencing
+# token of our term, or 0 if another replica leads.
+# KEYS: leader, epoch. ARGV: replica id, lease ms
+_ACQUIRE = redis.register_script(
+    """
+    local prefix = ARGV[1] .. ':'
+    local current = redis.call('GET', KEYS[1])
+    if current then
+        if string.sub(current, 1, #prefix) ~= prefix then
+            return 0
+        end
+        redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        return tonumber(string.sub(current, #prefix + 1))
+    end
+    local token = redis.call('INCR', KEYS[2])
+    redis.call('SET', KEYS[1], prefix .. token, 'PX', ARGV[2])
+    return token
+    """
+)
+
+# Give the lease up if it is still ours.
+# KEYS: leader. ARGV: replica id
+_RESIGN = redis.register_script(
+    """
+    local current = redis.call('GET', KEYS[1])
+    if current and string.sub(current, 1, #ARGV[1] + 1) == ARGV[1] .. ':' then
+        redis.call('DEL', KEYS[1])
+    end
+    return 1
+    """
+)
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], Awaitable[None]]
+    interval: float | None  # seconds between runs; None for a job that runs until cancelled
+    leader_only: bool
+
+
+class Scheduler:
+    """Runs background jobs, the leader-only ones on exactly one replica.
+
+    Leadership is a Redis lease renewed every third of its lifetime. Each
+    term gets a fencing token from ``EPOCH_KEY``; periodic jobs check it
+    before every run, so a replica that lost the lease (e.g. while Redis was
+    unreachable) skips work instead of racing the new leader. Crashed jobs
+    are logged and started again after ``RESTART_DELAY``.
+    """
+
+    def __init__(self, lease_seconds: float) -> None:
+        self.replica_id = uuid.uuid4().hex
+        self.lease_seconds = lease_seconds
+        self.token: int | None = None  # fencing token while this replica leads
+        self._jobs: list[Job] = []
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._election: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.token is not None
+
+    def every(
+        self, interval: float, func: Callable[[], Awaitable[None]], name: str, leader_only: bool = True
+    ) -> None:
+        self._jobs.append(Job(name, func, interval, leader_only))
+
+    def forever(
+        self, func: Callable[[], Awaitable[None]], name: str, leader_only: bool = True
+    ) -> None:
+        self._jobs.append(Job(name, func, None, leader_only))
+
+    def start(self) -> None:
+        for job in self._jobs:
+            if not job.leader_only:
+                self._start(job)
+        if any(job.leader_only for job in self._jobs):
+            self._election = asyncio.create_task(self._elect())
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        if self._election is not None:
+            tasks.append(self._election)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._election = None
+
+        if self.token is not None:
+            self.token = None
+            try:
+                await _RESIGN(keys=[LEADER_KEY], args=[self.replica_id])
+            except Exception:
+                log.warning("Could not release the scheduler lease", exc_info=True)
+
+    async def holds_lease(self, token: int) -> bool:
+        """Whether the lease in Redis is still the one issued with ``token``."""
+        return await redis.get(LEADER_KEY) == f"{self.replica_id}:{token}"
+
+    # ── Leader election ──────────────────────────────────────────────
+
+    async def _elect(self) -> None:
+        lease_ms = int(self.lease_seconds * 1000)
+        valid_until = 0.0
+        while True:
+            try:
+                renewed_at = time.monotonic()
+                token = await _ACQUIRE(keys=[LEADER_KEY, EPOCH_KEY], args=[self.replica_id, lease_ms])
+                valid_until = renewed_at + self.lease_seconds
+            except Exception:
+                log.warning("Scheduler lease renewal failed", exc_info=True)
+                # Keep leading only while the last lease we saw is still valid
+                token = self.token if time.monotonic() < valid_until else 0
+
+            if token and self.token != token:
+                self._step_down()
+                self.token = token
+                log.info("Became scheduler leader (token %d)", token)
+                for job in self._jobs:
+                    if job.leader_only:
+                        self._start(job)
+            elif not token and self.token is not None:
+                log.warning("Lost scheduler leadership (token %d)", self.token)
+                self._step_down()
+
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    def _step_down(self) -> None:
+        self.token = None
+        for job in self._jobs:
+            if job.leader_only and (task := self._tasks.pop(job.name, None)) is not None:
+                task.cancel()
+
+    # ── Supervision ──────────────────────────────────────────────────
+
+    def _start(self, job: Job) -> None:
+        self._tasks[job.name] = asyncio.create_task(self._supervise(job), name=f"job:{job.name}")
+
+    async def _supervise(self, job: Job) -> None:
+        token = self.token
+        while True:
+            try:
+                if job.interval is None:
+                    await job.func()
+                    log.warning("Job %s returned, starting it again", job.name)
+                else:
+                    await self._run_periodic(job, token)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Job %s crashed, restarting in %ds", job.name, RESTART_DELAY)
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def _run_periodic(self, job: Job, token: int | None) -> None:
+        while True:
+            if token is not None and not await self.holds_lease(token):
+                log.warning("Skipping %s, lease %d is no longer held", job.name, token)
+            else:
+                started = time.perf_counter()
+                try:
+                    await job.func()
+                except Exception:
+                    log.exception("Error in job %s", job.name)
+                else:
+                    log.debug("Job %s done in %.1f ms", job.name, (time.perf_counter() - started) * 1000)
+            await asyncio.sleep(job.interval)  # type: ignore[arg-type]
+
+
+scheduler = Scheduler(lease_seconds=settings.leader_lease_seconds)
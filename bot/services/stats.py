@@ -0,0 +1,108 @@
+import logging
+from collections import Counter
+from dataclasses import dataclass
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.db.models import Item, ItemQueue, Label
+from bot.services.redis import redis
+
+log = logging.getLogger(__name__)
+
+STATUS_KEY = "stats:status"  # hash: item status -> number of items
+RATED_KEY = "stats:rated"  # hash: user_id -> number of rated labels
+
+STATUSES = ("pending", "locked", "labeled", "skipped")
+
+
+@dataclass
+class GlobalStats:
+    by_status: dict[str, int]
+    rated_by_user: dict[int, int]
+
+    @property
+    def total(self) -> int:
+        return sum(self.by_status.values())
+
+    @property
+    def remaining(self) -> int:
+        return self.by_status.get("pending", 0) + self.by_status.get("locked", 0)
+
+
+async def move_items(
+    moves: Counter[tuple[str, str]], rated: Counter[int] | None = None
+) -> None:
+    """Apply committed status transitions, keyed by ``(old, new)``, to the counters.
+
+    Called after the DB commit. A failed update only leaves the counters off
+    until the next reconciliation, so it never fails the caller.
+    """
+    moves = +moves  # drop zero counts
+    if not moves and not rated:
+        return
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            for (old, new), n in moves.items():
+                if old:
+                    pipe.hincrby(STATUS_KEY, old, -n)
+                if new:
+                    pipe.hincrby(STATUS_KEY, new, n)
+            for user_id, n in (rated or {}).items():
+                pipe.hincrby(RATED_KEY, str(user_id), n)
+            await pipe.execute()
+    except Exception:
+        log.warning("Could not update stats counters, they will be fixed by reconciliation", exc_info=True)
+
+
+async def read_stats() -> GlobalStats | None:
+    """Current counters, or ``None`` if they have not been built yet."""
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hgetall(STATUS_KEY)
+        pipe.hgetall(RATED_KEY)
+        by_status, rated = await pipe.execute()
+    if not by_status:
+        return None
+    return GlobalStats(
+        by_status={status: int(by_status.get(status, 0)) for status in STATUSES},
+        rated_by_user={int(uid): int(n) for uid, n in rated.items() if int(n) > 0},
+    )
+
+
+async def reconcile_stats(session: AsyncSession) -> GlobalStats:
+    """Recount everything from the DB and overwrite the counters."""
+    by_status = dict.fromkeys(STATUSES, 0)
+    # Queued items count with their live status, archived ones with the final one
+    status = func.coalesce(ItemQueue.status, Item.status)
+    rows = await session.execute(
+        select(status, func.count())
+        .select_from(Item)
+        .outerjoin(ItemQueue, ItemQueue.item_id == Item.id)
+        .group_by(status)
+    )
+    by_status.update({status: count for status, count in rows.tuples()})
+
+    rows = await session.execute(
+        select(Label.user_id, func.count()).where(Label.action == "rated").group_by(Label.user_id)
+    )
+    rated = {user_id: count for user_id, count in rows.tuples()}
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(STATUS_KEY, RATED_KEY)
+        pipe.hset(STATUS_KEY, mapping=by_status)
+        if rated:
+            pipe.hset(RATED_KEY, mapping={str(uid): n for uid, n in rated.items()})
+        await pipe.execute()
+
+    return GlobalStats(by_status=by_status, rated_by_user=rated)
+
+
+async def refresh_stats(session_factory: async_sessionmaker) -> None:
+    """Periodic recount from the DB.
+
+    Transitions committed while it runs may be counted twice or not at all;
+    the next run corrects that.
+    """
+    async with session_factory() as session:
+        stats = await reconcile_stats(session)
+    log.info("Stats reconciled: %d item(s)", stats.total)
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from bot.config import settings
+from bot.db.models import User
+from bot.services.redis import redis
+
+log = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "users:invalidate"
+RECONNECT_DELAY = 5  # seconds
+
+MISS = object()
+
+
+class UserCache:
+    """Bounded LRU of whitelist lookups; ``None`` entries remember unknown users."""
+
+    def __init__(self, ttl: float, negative_ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[int, tuple[float, User | None]] = OrderedDict()
+
+    def get(self, user_id: int) -> User | None | object:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return MISS
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return MISS
+        self._entries.move_to_end(user_id)
+        return user
+
+    def put(self, user_id: int, user: User | None) -> None:
+        ttl = self.ttl if user is not None else self.negative_ttl
+        self._entries[user_id] = (time.monotonic() + ttl, user)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+
+
+user_cache = UserCache(
+    ttl=settings.user_cache_ttl_seconds,
+    negative_ttl=settings.user_cache_negative_ttl_seconds,
+    max_size=settings.user_cache_size,
+)
+
+
+async def invalidate_users(*user_ids: int) -> None:
+    """Drop users from this replica's cache and tell the other replicas to do the same."""
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+    if settings.user_cache_pubsub and user_ids:
+        await redis.publish(INVALIDATE_CHANNEL, ",".join(map(str, user_ids)))
+
+
+async def listen_user_invalidations() -> None:
+    while True:
+        try:
+            async with redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    for raw in message["data"].split(","):
+                        user_cache.invalidate(int(raw))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("User invalidation listener failed, reconnecting")
+        await asyncio.sleep(RECONNECT_DELAY)
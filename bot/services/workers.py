@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import multiprocessing
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, TypeVar
+
+from bot.config import settings
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Native code that drops the GIL (polars, lzma, hashlib on large buffers) goes to
+# threads; pure-Python loops go to processes so they can't starve the event loop.
+_threads = ThreadPoolExecutor(max_workers=settings.worker_threads, thread_name_prefix="worker")
+_processes: ProcessPoolExecutor | None = None
+_heavy_slots = asyncio.Semaphore(settings.heavy_jobs_max)
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _processes
+    if _processes is None:
+        _processes = ProcessPoolExecutor(
+            max_workers=settings.worker_processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _processes
+
+
+async def _submit(executor: Executor, fn: Callable[..., T], *args: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args))
+
+
+async def run_in_thread(fn: Callable[..., T], *args: Any) -> T:
+    return await _submit(_threads, fn, *args)
+
+
+async def run_in_process(fn: Callable[..., T], *args: Any) -> T:
+    """``fn`` and its arguments must be picklable (module-level function, plain data)."""
+    return await _submit(_process_pool(), fn, *args)
+
+
+@asynccontextmanager
+async def heavy_job() -> AsyncIterator[None]:
+    """Hold one of the ``heavy_jobs_max`` slots for an import/export."""
+    if _heavy_slots.locked():
+        log.info("Heavy job queued, %d already running", settings.heavy_jobs_max)
+    async with _heavy_slots:
+        yield
+
+
+def shutdown_workers(wait: bool = False) -> None:
+    """Stop the pools; ``wait`` blocks until the worker processes have exited."""
+    _threads.shutdown(wait=wait, cancel_futures=True)
+    if _processes is not None:
+        _processes.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class BatchWriter(Generic[T, R]):
+    """Group concurrent writes into one flush every ``interval`` seconds or ``batch_size`` items.
+
+    ``submit`` returns only after the batch holding the item has been flushed,
+    so callers can rely on the write being durable. ``flush`` receives the
+    batch and returns one result per item, in order.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[list[T]], Awaitable[list[R]]],
+        interval: float,
+        batch_size: int,
+    ) -> None:
+        self._flush = flush
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending: list[tuple[T, asyncio.Future[R]]] = []
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, item: T) -> R:
+        if self._task is None or self._closing:
+            raise RuntimeError("BatchWriter is not running")
+        future: asyncio.Future[R] = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return await future
+
+    async def close(self) -> None:
+        """Stop accepting writes and wait until everything pending is flushed."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._pending:
+                await self._flush_pending()
+            if self._closing:
+                return
+
+    async def _flush_pending(self) -> None:
+        batch = self._pending[: self.batch_size]
+        del self._pending[: self.batch_size]
+
+        try:
+            results = await self._flush([item for item, _ in batch])
+        except Exception as exc:
+            log.exception("Write-behind flush of %d item(s) failed", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)